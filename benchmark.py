@@ -0,0 +1,276 @@
+#!/usr/bin/python
+
+""" benchmarks for the evaluation and training hot paths on synthetic,
+    Enron-shaped datasets
+
+    a synthetic dataset has the columns of final_project_dataset.pkl
+    (14 financial and 5 email features, email_address and poi), the same
+    18/146 share of POIs, roughly the same share of 'NaN' strings per
+    feature and log-normal values of the same magnitudes, plus the three
+    POI ratio features poi_id.py adds. every stage runs in its own process
+    on a freshly generated dataset, and records wall time, peak RSS (and
+    the peak before the stage started, i.e. the generated dataset) and,
+    for the fold based stages, folds/s
+
+        python benchmark.py --rows 146 10000 1000000 -o results.json
+        python benchmark.py --baseline baseline.json
+        python benchmark.py --save-baseline baseline.json
+
+    with --baseline, every (stage, rows) result is compared against the
+    stored one and the run exits with status 1 if any stage got slower
+    by more than --tolerance. a stage that raises, dies or runs longer
+    than --stage-timeout seconds is recorded with its error, and the run
+    exits with status 1
+"""
+
+import Queue
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+import numpy
+
+from feature_engineering import EMAIL_FEATURES, FINANCIAL_FEATURES, POI_RATIOS, POI_RATIO_FEATURES, poi_ratio
+
+sys.path.append("../tools/")
+
+POI_RATE = 18 / 146.0
+### feature -> (share of 'NaN', median value, log-normal sigma), roughly as in the Enron data
+FEATURE_SHAPES = {
+    'salary': (0.35, 2.6e5, 0.5),
+    'deferral_payments': (0.73, 2.2e5, 1.5),
+    'total_payments': (0.14, 1.1e6, 1.5),
+    'loan_advances': (0.97, 2.0e6, 2.5),
+    'bonus': (0.44, 7.5e5, 1.0),
+    'restricted_stock_deferred': (0.88, -1.4e5, 1.5),
+    'deferred_income': (0.66, -1.5e5, 1.5),
+    'total_stock_value': (0.14, 1.1e6, 1.5),
+    'expenses': (0.35, 4.6e4, 0.8),
+    'exercised_stock_options': (0.30, 1.3e6, 1.5),
+    'other': (0.36, 5.2e4, 2.0),
+    'long_term_incentive': (0.55, 4.2e5, 1.0),
+    'restricted_stock': (0.25, 4.5e5, 1.2),
+    'director_fees': (0.88, 1.1e5, 0.3),
+    'to_messages': (0.41, 1.2e3, 1.2),
+    'from_poi_to_this_person': (0.41, 3.5e1, 1.5),
+    'from_messages': (0.41, 4.0e1, 1.5),
+    'from_this_person_to_poi': (0.41, 8.0e0, 1.5),
+    'shared_receipt_with_poi': (0.41, 6.0e2, 1.2),
+}
+FEATURE_LIST = ['poi'] + FINANCIAL_FEATURES + EMAIL_FEATURES + POI_RATIO_FEATURES
+STAGES = ["pickle_dump_load", "binary_dump_load", "featureFormat", "feature_store", "test_classifier",
+          "grid_search"]
+RESULT_FORMAT_STRING = "{:>18s}\t{:>8d} rows\t{:>9.3f} s\t{:>9.1f} MB peak RSS\t{}"
+COMPARE_FORMAT_STRING = "{:>18s}\t{:>8d} rows\t{:>9.3f} s\tbaseline {:>9.3f} s\t{:>+7.1%}{}"
+
+
+def make_dataset(rows, seed=0):
+    """ a dataset dict of rows synthetic employees, as poi_id.py builds it """
+    random = numpy.random.RandomState(seed)
+    poi = random.rand(rows) < POI_RATE
+    columns = {}
+    for feature, (nan_share, median, sigma) in sorted(FEATURE_SHAPES.items()):
+        values = abs(median) * random.lognormal(0.0, sigma, rows)
+        ### POIs are paid more and write to other POIs more
+        values[poi] *= 2.5
+        values = numpy.round(values) * numpy.sign(median)
+        values[random.rand(rows) < nan_share] = numpy.nan
+        columns[feature] = values
+    for name, numerator, denominator in POI_RATIOS:
+        columns[name] = poi_ratio(columns[numerator], [columns[term] for term in denominator])
+    dataset = {}
+    for row in range(rows):
+        record = {'poi': bool(poi[row]), 'email_address': 'employee.%d@enron.com' % row}
+        for feature, values in columns.items():
+            value = values[row]
+            if value != value:
+                record[feature] = 'NaN'
+            elif feature in POI_RATIO_FEATURES:
+                record[feature] = float(value)
+            else:
+                record[feature] = int(value)
+        dataset['EMPLOYEE %07d' % row] = record
+    return dataset
+
+
+def peak_rss_mb():
+    ### ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1.0 if sys.platform == "darwin" else 1024.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20
+
+
+def stage_pickle_dump_load(dataset, options):
+    filename = os.path.join(options.tmpdir, "dataset.pkl")
+    with open(filename, "w") as outfile:
+        pickle.dump(dataset, outfile)
+    with open(filename, "r") as infile:
+        pickle.load(infile)
+    return {"bytes": os.path.getsize(filename)}
+
+
+def stage_binary_dump_load(dataset, options):
+    from feature_store import FeatureStore, load_feature_store
+    filename = os.path.join(options.tmpdir, "dataset.bin")
+    FeatureStore.from_dataset(dataset).dump(filename)
+    store = load_feature_store(filename)
+    store.feature_format(FEATURE_LIST)
+    return {"bytes": os.path.getsize(filename)}
+
+
+def stage_featureFormat(dataset, options):
+    from feature_format import featureFormat
+    featureFormat(dataset, FEATURE_LIST, remove_NaN=True, sort_keys=True)
+    return {}
+
+
+def stage_feature_store(dataset, options):
+    from feature_store import clear_cache, get_feature_store
+    clear_cache()
+    get_feature_store(dataset).feature_format(FEATURE_LIST)
+    return {}
+
+
+def stage_test_classifier(dataset, options):
+    from sklearn.ensemble import RandomForestClassifier
+    from tester import evaluate_classifier
+    clf = RandomForestClassifier(n_estimators=10, random_state=0)
+    start = time.time()
+    result = evaluate_classifier(clf, dataset, FEATURE_LIST, options.folds, n_jobs=options.n_jobs)
+    return {"folds": result["folds"], "folds_per_s": result["folds"] / (time.time() - start)}
+
+
+def stage_grid_search(dataset, options):
+    from sklearn.ensemble import RandomForestClassifier
+    from tuning import grid_search
+    param_grid = {'n_estimators': [5, 10], 'min_samples_leaf': [1, 3], 'random_state': [0]}
+    folds = max(1, options.folds // 10)
+    start = time.time()
+    results = grid_search(RandomForestClassifier(), param_grid, dataset, FEATURE_LIST, folds,
+                          n_jobs=options.n_jobs, cache_filename=None)
+    return {"folds": folds * len(results), "folds_per_s": folds * len(results) / (time.time() - start)}
+
+
+def _run_stage(stage, rows, options, queue):
+    dataset = make_dataset(rows, options.seed)
+    dataset_rss = peak_rss_mb()
+    start = time.time()
+    try:
+        extra = globals()["stage_" + stage](dataset, options)
+    except ImportError as e:
+        queue.put({"stage": stage, "rows": rows, "skipped": str(e)})
+        return
+    except Exception as e:
+        queue.put({"stage": stage, "rows": rows, "error": "%s: %s" % (type(e).__name__, e)})
+        return
+    result = {"stage": stage, "rows": rows, "wall_s": time.time() - start, "peak_rss_mb": peak_rss_mb(),
+              "dataset_rss_mb": dataset_rss}
+    result.update(extra)
+    queue.put(result)
+
+
+def run_stage(stage, rows, options):
+    """ run one stage in a fresh process, so peak RSS is the stage's own
+
+        a process that dies without a result, or is still running after
+        options.stage_timeout seconds, gives a result with an "error"
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run_stage, args=(stage, rows, options, queue))
+    process.start()
+    deadline = time.time() + options.stage_timeout
+    result = None
+    error = None
+    while result is None and error is None:
+        try:
+            result = queue.get(timeout=1)
+        except Queue.Empty:
+            if not process.is_alive():
+                ### the result may have been queued just before the exit
+                try:
+                    result = queue.get(timeout=1)
+                except Queue.Empty:
+                    error = "process exited with code %s" % process.exitcode
+            elif time.time() > deadline:
+                process.terminate()
+                error = "timed out after %d s" % options.stage_timeout
+    process.join()
+    if result is None:
+        result = {"stage": stage, "rows": rows, "error": error}
+    elif process.exitcode and "error" not in result:
+        result["error"] = "process exited with code %s" % process.exitcode
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """ print each result against the baseline, return the regressed ones """
+    previous = dict(((result["stage"], result["rows"]), result) for result in baseline["results"])
+    regressions = []
+    for result in results:
+        old = previous.get((result["stage"], result["rows"]))
+        if old is None or "wall_s" not in old or "wall_s" not in result:
+            continue
+        change = result["wall_s"] / old["wall_s"] - 1
+        flag = ""
+        if change > tolerance:
+            flag = "\tREGRESSION"
+            regressions.append(result)
+        print COMPARE_FORMAT_STRING.format(result["stage"], result["rows"], result["wall_s"], old["wall_s"],
+                                           change, flag)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the evaluation and training hot paths.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[146, 1000, 10000])
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    parser.add_argument("--folds", type=int, default=100, help="folds for test_classifier")
+    parser.add_argument("--n-jobs", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--save-baseline", help="also write the results here")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed slowdown, 0.1 = 10%%")
+    parser.add_argument("--stage-timeout", type=float, default=3600, help="seconds a stage may run")
+    options = parser.parse_args(argv)
+    options.tmpdir = tempfile.mkdtemp(prefix="poi_benchmark_")
+
+    results = []
+    for rows in options.rows:
+        for stage in options.stages:
+            result = run_stage(stage, rows, options)
+            results.append(result)
+            if "skipped" in result:
+                print "{:>18s}\t{:>8d} rows\tskipped: {}".format(stage, rows, result["skipped"])
+                continue
+            if "error" in result:
+                print "{:>18s}\t{:>8d} rows\terror: {}".format(stage, rows, result["error"])
+                continue
+            extra = "\t{:0.1f} folds/s".format(result["folds_per_s"]) if "folds_per_s" in result else ""
+            print RESULT_FORMAT_STRING.format(stage, rows, result["wall_s"], result["peak_rss_mb"], extra)
+    for name in os.listdir(options.tmpdir):
+        os.remove(os.path.join(options.tmpdir, name))
+    os.rmdir(options.tmpdir)
+
+    report = {"python": platform.python_version(), "numpy": numpy.__version__, "platform": platform.platform(),
+              "folds": options.folds, "n_jobs": options.n_jobs, "seed": options.seed, "results": results}
+    for filename in filter(None, [options.output, options.save_baseline]):
+        with open(filename, "w") as outfile:
+            json.dump(report, outfile, indent=2, sort_keys=True)
+    if options.baseline:
+        with open(options.baseline, "r") as infile:
+            baseline = json.load(infile)
+        if compare(results, baseline, options.tolerance):
+            sys.exit(1)
+    if any("error" in result for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/python
+
+""" stability ranking of features by their ANOVA F-score (f_classif)
+    on every training split of the tester folds
+
+    instead of fitting SelectKBest on one split, the per-class counts,
+    sums and sums of squares of every feature are accumulated for all
+    training splits at once (one matrix product per class), which gives
+    the f_classif score of every feature on every fold in a single pass
+
+        ranking = rank_features(my_dataset, my_feature_list, k=7)
+        print_ranking(ranking)
+"""
+
+import numpy
+
+from tester import fold_indices, labels_and_features
+
+RANKING_HEADER = "\t{:>28s}\t{:>10s}\t{:>12s}\t{:>12s}".format("feature", "selected", "mean F", "variance F")
+RANKING_FORMAT_STRING = "\t{:>28s}\t{:>10.3f}\t{:>12.4f}\t{:>12.4f}"
+
+
+def fold_f_scores(labels, features, cv, chunk_size=100):
+    """ f_classif scores for each training split in cv, as a folds x
+        features array
+
+        the training splits are turned into membership matrices
+        chunk_size folds at a time, so memory stays at chunk_size x rows
+    """
+    classes = numpy.unique(labels)
+    squares = features ** 2
+    in_class = [labels == label for label in classes]
+    scores = []
+    chunk = []
+
+    def score_chunk(chunk):
+        membership = numpy.zeros((len(chunk), len(labels)))
+        for ii, train_idx in enumerate(chunk):
+            membership[ii, train_idx] = 1.0
+        ### per class running counts, sums and sums of squares for every fold
+        counts = [membership[:, rows].sum(axis=1)[:, numpy.newaxis] for rows in in_class]
+        sums = [membership[:, rows].dot(features[rows]) for rows in in_class]
+        sum_squares = sum(membership[:, rows].dot(squares[rows]) for rows in in_class)
+        n_samples = sum(counts)
+        total = sum(sums)
+        ### same arithmetic as sklearn.feature_selection.f_oneway
+        ss_total = sum_squares - total ** 2 / n_samples
+        ss_between = sum(class_sum ** 2 / class_count for class_sum, class_count in zip(sums, counts))
+        ss_between -= total ** 2 / n_samples
+        ss_within = ss_total - ss_between
+        between_df = len(classes) - 1
+        within_df = n_samples - len(classes)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            return (ss_between / between_df) / (ss_within / within_df)
+
+    for train_idx, test_idx in cv:
+        chunk.append(train_idx)
+        if len(chunk) == chunk_size:
+            scores.append(score_chunk(chunk))
+            chunk = []
+    if chunk:
+        scores.append(score_chunk(chunk))
+    return numpy.vstack(scores)
+
+
+def rank_features(dataset, feature_list, folds=1000, k=7):
+    """ rank feature_list[1:] by how often SelectKBest(f_classif, k) would
+        pick them across the tester folds, then by mean F-score
+
+        returns a list of dicts with the feature name, selection frequency
+        and the mean and variance of its F-score over the folds
+    """
+    labels, features = labels_and_features(dataset, feature_list)
+    scores = fold_f_scores(labels, features, fold_indices(labels, folds))
+    ### SelectKBest treats an undefined score as the lowest possible one
+    clean = numpy.where(numpy.isnan(scores), numpy.finfo(scores.dtype).min, scores)
+    top_k = numpy.argsort(clean, axis=1, kind="mergesort")[:, -k:]
+    frequency = numpy.bincount(top_k.ravel(), minlength=scores.shape[1]) / float(len(scores))
+    with numpy.errstate(invalid="ignore"):
+        means = numpy.nanmean(scores, axis=0)
+        variances = numpy.nanvar(scores, axis=0)
+    ranking = [{"feature": feature, "frequency": frequency[ii], "mean": means[ii], "variance": variances[ii]}
+               for ii, feature in enumerate(feature_list[1:])]
+    return sorted(ranking, key=lambda row: (row["frequency"], numpy.nan_to_num(row["mean"])), reverse=True)
+
+
+def print_ranking(ranking):
+    print RANKING_HEADER
+    for row in ranking:
+        print RANKING_FORMAT_STRING.format(row["feature"], row["frequency"], row["mean"], row["variance"])
@@ -0,0 +1,150 @@
+#!/usr/bin/python
+
+""" wrapper feature-subset search scored with the tester protocol
+
+    sequential forward selection, backward elimination and their floating
+    variants, every subset scored by fitting the estimator on the tester
+    folds and summing the confusion counts
+
+    every subset is scored on exactly the rows and folds test_classifier
+    would use for it: the rows that are not all zero for the subset, and
+    the tester folds of their labels. subsets keeping the same rows share
+    one set of folds. candidates of a step are scored in parallel and
+    every subset is scored at most once, so the score of the subset found
+    is what test_classifier reports for it
+
+        subset, score, history = feature_search(clf, my_dataset, my_feature_list,
+                                                direction="forward", floating=True)
+"""
+
+import numpy
+from sklearn.base import clone
+from sklearn.externals.joblib import Parallel, delayed
+
+from tester import fold_counts, fold_indices, labels_and_features, performance_metrics
+
+STEP_FORMAT_STRING = "\t{:>2d} features\t{}: {:>0.5f}\t{}"
+
+
+def _score_subset(estimator, features, labels, train_folds, test_folds, scoring):
+    counts = sum(fold_counts(clone(estimator), features, labels, train_idx, test_idx)
+                 for train_idx, test_idx in zip(train_folds, test_folds))
+    true_negatives, false_positives, false_negatives, true_positives = [int(c) for c in counts]
+    try:
+        return performance_metrics(true_positives, false_positives, false_negatives, true_negatives)[scoring]
+    except ZeroDivisionError:
+        return 0.0
+
+
+class SubsetScorer(object):
+    """ scores feature subsets (tuples of column names) on shared folds,
+        remembering every score
+    """
+
+    def __init__(self, estimator, dataset, feature_list, folds=1000, scoring="f1", n_jobs=1):
+        self.estimator = estimator
+        self.dataset = dataset
+        self.folds = folds
+        self.scoring = scoring
+        self.n_jobs = n_jobs
+        self.feature_list = list(feature_list)
+        self.scores = {}
+        self._splits = {}
+
+    def splits(self, labels):
+        """ (train_folds, test_folds) of the tester folds for labels
+
+            StratifiedShuffleSplit folds all have the same sizes, so they
+            stack into two arrays that joblib can memory-map to workers;
+            they depend on the labels only and are made once per distinct
+            labels array
+        """
+        key = labels.tostring()
+        if key not in self._splits:
+            splits = list(fold_indices(labels, self.folds))
+            self._splits[key] = (numpy.array([train_idx for train_idx, test_idx in splits]),
+                                 numpy.array([test_idx for train_idx, test_idx in splits]))
+        return self._splits[key]
+
+    def _job(self, key):
+        subset = [feature for feature in self.feature_list[1:] if feature in key]
+        labels, features = labels_and_features(self.dataset, self.feature_list[:1] + subset)
+        train_folds, test_folds = self.splits(labels)
+        return delayed(_score_subset)(self.estimator, features, labels, train_folds, test_folds, self.scoring)
+
+    def score(self, subsets):
+        """ the scores of subsets, evaluating the ones not seen before in parallel """
+        keys = [frozenset(subset) for subset in subsets]
+        pending = list(set(key for key in keys if key not in self.scores))
+        scored = Parallel(n_jobs=self.n_jobs)(self._job(key) for key in pending)
+        self.scores.update(zip(pending, scored))
+        return [self.scores[key] for key in keys]
+
+    def best(self, subsets):
+        subsets = list(subsets)
+        scores = self.score(subsets)
+        best = int(numpy.argmax(scores))
+        return subsets[best], scores[best]
+
+
+def feature_search(estimator, dataset, feature_list, direction="forward", floating=False, k_features=None,
+                   folds=1000, scoring="f1", n_jobs=1, verbose=True):
+    """ search feature_list[1:] ('poi' first, as everywhere else) for the
+        subset that maximises scoring on the tester folds
+
+        direction "forward" adds one feature per step starting from none,
+        "backward" removes one per step starting from all of them; with
+        floating=True every step is followed by conditional removals
+        (forward) or additions (backward) for as long as they beat the
+        best subset of that size found so far. the search runs until it
+        reaches k_features (default: all candidates for forward, one for
+        backward)
+
+        returns the best subset found (in feature_list order), its score
+        and the (subset, score) of every step
+    """
+    scorer = SubsetScorer(estimator, dataset, feature_list, folds, scoring, n_jobs)
+    candidates = list(feature_list[1:])
+    forward = direction == "forward"
+    if direction not in ("forward", "backward"):
+        raise ValueError("direction must be 'forward' or 'backward', not %r" % direction)
+    if k_features is None:
+        k_features = len(candidates) if forward else 1
+    k_features = max(1, min(k_features, len(candidates)))
+
+    def ordered(subset):
+        return tuple(feature for feature in candidates if feature in subset)
+
+    def grow(subset):
+        return scorer.best(ordered(subset + (feature,)) for feature in candidates if feature not in subset)
+
+    def shrink(subset):
+        return scorer.best(tuple(other for other in subset if other != feature) for feature in subset)
+
+    step, undo = (grow, shrink) if forward else (shrink, grow)
+    if forward:
+        subset, score = (), 0.0
+    else:
+        subset = tuple(candidates)
+        score = scorer.score([subset])[0]
+    best_by_size = {len(subset): (subset, score)} if subset else {}
+    history = [(subset, score)] if subset else []
+    while len(subset) != k_features:
+        subset, score = step(subset)
+        if score > best_by_size.get(len(subset), ((), -1.0))[1]:
+            best_by_size[len(subset)] = (subset, score)
+        history.append((subset, score))
+        if verbose:
+            print STEP_FORMAT_STRING.format(len(subset), scoring, score, list(subset))
+        ### floating: undo steps while that beats the best subset of the smaller/larger size
+        while floating and (len(subset) > 1 if forward else len(subset) < len(candidates)):
+            undone, undone_score = undo(subset)
+            if undone_score <= best_by_size.get(len(undone), ((), -1.0))[1]:
+                break
+            subset, score = undone, undone_score
+            best_by_size[len(subset)] = (subset, score)
+            history.append((subset, score))
+            if verbose:
+                print STEP_FORMAT_STRING.format(len(subset), scoring, score, list(subset))
+    best_subset, best_score = max(best_by_size.values(), key=lambda pair: pair[1])
+    return list(best_subset), best_score, history
@@ -0,0 +1,283 @@
+#!/usr/bin/python
+
+""" a columnar, float64 copy of a dataset dict (name -> {feature: value})
+
+    featureFormat walks the nested dicts and converts every 'NaN' string
+    each time it is called; a FeatureStore does that conversion once for
+    every numeric feature and then serves any feature subset from the
+    stored columns, with the same row filtering as featureFormat
+
+        store = get_feature_store(my_dataset)
+        data = store.feature_format(my_feature_list)
+
+    gives the same array as
+        featureFormat(my_dataset, my_feature_list, sort_keys=True)
+
+    a store can be written to a binary file and memory-mapped back:
+        8 bytes   magic, "POISTORE"
+        8 bytes   little-endian uint64, length of the JSON header
+        header    JSON: version, keys, features, digest, offsets
+        matrix    float64, rows x features, Fortran order
+        nan_mask  uint8, rows x features, Fortran order
+    both arrays start on a 64 byte boundary
+"""
+
+import hashlib
+import json
+import struct
+from collections import OrderedDict
+
+import numpy
+
+
+def dataset_hash(dataset):
+    """ sha1 hex digest of the dataset contents, independent of dict order """
+    digest = hashlib.sha1()
+    for key in sorted(dataset):
+        record = dataset[key]
+        digest.update(repr(key))
+        for feature in sorted(record):
+            digest.update(repr((feature, record[feature])))
+    return digest.hexdigest()
+
+
+def matrix_hash(keys, features, matrix, nan_mask):
+    """ sha1 hex digest of a store's contents, for stores not built from a dict """
+    digest = hashlib.sha1()
+    digest.update(repr(list(keys)))
+    digest.update(repr(list(features)))
+    digest.update(numpy.ascontiguousarray(matrix, dtype="<f8").tostring())
+    digest.update(numpy.ascontiguousarray(nan_mask, dtype=numpy.uint8).tostring())
+    return digest.hexdigest()
+
+
+def format_rows(values, nan_mask, feature_list, remove_NaN=True, remove_all_zeroes=True, remove_any_zeroes=False):
+    """ the rows of values (columns feature_list) featureFormat would keep,
+        and the values with NaN replaced by 0 if remove_NaN
+    """
+    if remove_NaN:
+        values = numpy.where(nan_mask, 0.0, values)
+    keep = numpy.ones(len(values), dtype=bool)
+    ### exclude 'poi' class as criteria.
+    test = values[:, 1:] if feature_list[0] == "poi" else values
+    if remove_all_zeroes:
+        ### NaN != 0, so rows with a NaN left in are kept, as in featureFormat
+        keep &= (test != 0).any(axis=1)
+    if remove_any_zeroes:
+        keep &= ~(test == 0).any(axis=1)
+    return keep, values
+
+
+class FeatureStore(object):
+    """ keys:     record names, sorted
+        features: names of the numeric features, one column each
+        matrix:   float64, Fortran ordered so that every column is contiguous
+        nan_mask: True where the dataset held the string 'NaN'
+        digest:   dataset_hash of the source dict, or matrix_hash
+    """
+
+    def __init__(self, keys, features, matrix, nan_mask, digest=None):
+        self.keys = list(keys)
+        self.features = list(features)
+        self.matrix = matrix
+        self.nan_mask = nan_mask
+        self.digest = digest if digest is not None else matrix_hash(keys, features, matrix, nan_mask)
+        self._columns = dict((feature, ii) for ii, feature in enumerate(self.features))
+
+    @classmethod
+    def from_dataset(cls, dataset, digest=None):
+        if digest is None:
+            digest = dataset_hash(dataset)
+        keys = sorted(dataset)
+        names = set()
+        for key in keys:
+            names.update(dataset[key])
+        features = []
+        columns = []
+        masks = []
+        for feature in sorted(names):
+            values = [dataset[key].get(feature, "NaN") for key in keys]
+            mask = numpy.array([value == "NaN" for value in values], dtype=bool)
+            try:
+                column = numpy.array([numpy.nan if missing else float(value)
+                                      for value, missing in zip(values, mask)], dtype=numpy.float64)
+            except (TypeError, ValueError):
+                ### non-numeric features such as email_address are left out
+                continue
+            features.append(feature)
+            columns.append(column)
+            masks.append(mask)
+        matrix = numpy.empty((len(keys), len(features)), dtype=numpy.float64, order="F")
+        nan_mask = numpy.empty((len(keys), len(features)), dtype=bool, order="F")
+        for ii in range(len(features)):
+            matrix[:, ii] = columns[ii]
+            nan_mask[:, ii] = masks[ii]
+        return cls(keys, features, matrix, nan_mask, digest)
+
+    def dump(self, filename):
+        """ write the store in the binary format described at the top of this module """
+        rows, columns = self.matrix.shape
+        header = {"version": BINARY_VERSION, "keys": self.keys, "features": self.features,
+                  "digest": self.digest, "shape": [rows, columns]}
+        ### the offsets are part of the header, so size it with placeholders first
+        header["matrix_offset"] = header["mask_offset"] = 0
+        start = _aligned(len(BINARY_MAGIC) + 8 + len(json.dumps(header)) + 64)
+        header["matrix_offset"] = start
+        header["mask_offset"] = _aligned(start + self.matrix.nbytes)
+        encoded = json.dumps(header)
+        encoded += " " * (start - len(BINARY_MAGIC) - 8 - len(encoded))
+        with open(filename, "wb") as outfile:
+            outfile.write(BINARY_MAGIC)
+            outfile.write(struct.pack("<Q", len(encoded)))
+            outfile.write(encoded)
+            outfile.write(numpy.asfortranarray(self.matrix, dtype="<f8").tostring(order="F"))
+            outfile.write("\0" * (header["mask_offset"] - start - self.matrix.nbytes))
+            outfile.write(numpy.asfortranarray(self.nan_mask, dtype=numpy.uint8).tostring(order="F"))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def to_dataset(self):
+        """ the store as a dataset dict, name -> {feature: value}, with
+            'NaN' where the source held it; only the numeric features are in
+            the store, so only they come back
+        """
+        return dict((key, dict((feature, "NaN" if self.nan_mask[row, column] else float(self.matrix[row, column]))
+                               for column, feature in enumerate(self.features)))
+                    for row, key in enumerate(self.keys))
+
+    def append(self, other):
+        """ a new store with the rows of other added, keys kept sorted
+
+            other must have the same features and none of the keys
+        """
+        if other.features != self.features:
+            raise ValueError("cannot append a store with features %r to one with %r" %
+                             (other.features, self.features))
+        duplicates = set(self.keys).intersection(other.keys)
+        if duplicates:
+            raise ValueError("records already in the dataset: %s" % ", ".join(sorted(duplicates)))
+        keys = self.keys + other.keys
+        ### two sorted runs, which sorted() merges in linear time
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        matrix = numpy.asfortranarray(numpy.vstack([self.matrix, other.matrix])[order])
+        nan_mask = numpy.asfortranarray(numpy.vstack([self.nan_mask, other.nan_mask])[order])
+        return FeatureStore([keys[ii] for ii in order], self.features, matrix, nan_mask)
+
+    def column_indices(self, feature_list):
+        try:
+            return [self._columns[feature] for feature in feature_list]
+        except KeyError as e:
+            raise KeyError("feature %s is not a numeric feature of this dataset" % e)
+
+    def column(self, feature):
+        """ the stored column itself, no copy """
+        return self.matrix[:, self.column_indices([feature])[0]]
+
+    def select(self, feature_list):
+        """ the raw columns for feature_list (NaN left in place)
+
+            a run of adjacent columns is returned as a view; any other
+            subset is gathered into a new array
+        """
+        indices = self.column_indices(feature_list)
+        if indices and indices == list(range(indices[0], indices[0] + len(indices))):
+            columns = slice(indices[0], indices[0] + len(indices))
+            return self.matrix[:, columns], self.nan_mask[:, columns]
+        return self.matrix[:, indices], self.nan_mask[:, indices]
+
+    def row_mask(self, feature_list, remove_NaN=True, remove_all_zeroes=True, remove_any_zeroes=False):
+        """ the rows featureFormat would keep, and their values """
+        values, nan_mask = self.select(feature_list)
+        return format_rows(values, nan_mask, feature_list, remove_NaN, remove_all_zeroes, remove_any_zeroes)
+
+    def feature_format(self, feature_list, remove_NaN=True, remove_all_zeroes=True, remove_any_zeroes=False):
+        """ featureFormat(dataset, feature_list, ..., sort_keys=True) """
+        keep, values = self.row_mask(feature_list, remove_NaN, remove_all_zeroes, remove_any_zeroes)
+        return numpy.ascontiguousarray(values[keep])
+
+
+BINARY_MAGIC = "POISTORE"
+BINARY_VERSION = 1
+
+
+def _aligned(offset, alignment=64):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def load_feature_store(filename, mmap_mode="r"):
+    """ open a store written by FeatureStore.dump
+
+        the matrix and mask are memory-mapped, so nothing is read until
+        it is used; mmap_mode=None reads both into memory instead
+    """
+    with open(filename, "rb") as infile:
+        if infile.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError("%s is not a binary dataset file" % filename)
+        header_length, = struct.unpack("<Q", infile.read(8))
+        header = json.loads(infile.read(header_length))
+    if header["version"] != BINARY_VERSION:
+        raise ValueError("unsupported binary dataset version %s in %s" % (header["version"], filename))
+    shape = tuple(header["shape"])
+
+    def array(dtype, offset):
+        if mmap_mode is None or 0 in shape:
+            with open(filename, "rb") as infile:
+                infile.seek(offset)
+                flat = numpy.fromfile(infile, dtype=dtype, count=shape[0] * shape[1])
+            return flat.reshape(shape, order="F")
+        return numpy.memmap(filename, dtype=dtype, mode=mmap_mode, offset=offset, shape=shape, order="F")
+
+    matrix = array("<f8", header["matrix_offset"])
+    nan_mask = array(numpy.uint8, header["mask_offset"]).view(bool)
+    return FeatureStore(header["keys"], header["features"], matrix, nan_mask, header["digest"])
+
+
+FEATURE_STORE_CACHE_SIZE = 4
+_STORES = OrderedDict()
+
+
+def dataset_fingerprint(dataset):
+    """ a hash of the dataset contents, independent of dict order; cheaper
+        than dataset_hash and stable within a process only
+    """
+    try:
+        return hash(frozenset((key, frozenset(record.iteritems())) for key, record in dataset.iteritems()))
+    except TypeError:
+        ### a record holding an unhashable value
+        return dataset_hash(dataset)
+
+
+def get_feature_store(dataset):
+    """ the FeatureStore for dataset, built once per dataset contents
+
+        a FeatureStore passed in is returned as is. stores are cached on
+        dataset_fingerprint, so a repeated call costs one hash of the
+        records instead of a conversion, and a dict edited in place gets
+        a new store; the FEATURE_STORE_CACHE_SIZE most recently used
+        stores are kept, older ones are evicted
+    """
+    if isinstance(dataset, FeatureStore):
+        return dataset
+    key = dataset_fingerprint(dataset)
+    store = _STORES.pop(key, None)
+    if store is None:
+        store = FeatureStore.from_dataset(dataset)
+    _STORES[key] = store
+    while len(_STORES) > FEATURE_STORE_CACHE_SIZE:
+        _STORES.popitem(last=False)
+    return store
+
+
+def dataset_digest(dataset):
+    """ the digest of a dataset dict or FeatureStore, shards_digest of a
+        directory of shards
+    """
+    if isinstance(dataset, basestring):
+        from shards import shards_digest
+        return shards_digest(dataset)
+    return get_feature_store(dataset).digest
+
+
+def clear_cache():
+    _STORES.clear()
@@ -0,0 +1,406 @@
+#!/usr/bin/python
+
+""" a random forest whose trees search splits over histograms of
+    quantile-binned features instead of sorted raw values
+
+    every feature is cut into at most 256 quantile bins once, and the
+    binned matrix (uint8, 1/8 of the float64 one) is shared by every
+    tree. trees grow a level at a time: the class counts of every
+    (node, bin) pair of a level come from one bincount per feature (one
+    sort of the occupied bins, for levels of many small nodes) instead
+    of a sort of the raw values per node, and trees are built in
+    parallel with n_jobs
+
+        binner = QuantileBinner().fit(features)
+        clf = HistRandomForestClassifier(n_estimators=10, binner=binner, n_jobs=-1)
+        test_classifier(clf, my_dataset, my_feature_list)
+        dump_classifier_and_data(clf, my_dataset, my_feature_list)
+
+    a binner that is already fitted is reused as is, so fitting it once on
+    the whole dataset gives every fold and tree the same bins; an unfitted
+    one is copied and the copy fitted, so the binner passed in never
+    changes and every fit bins its own data. split
+    thresholds are kept as raw feature values, with the same
+    children_left/children_right/feature/threshold/value arrays as a
+    sklearn tree_, so predicting needs no binning
+"""
+
+import copy
+
+import numpy
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.externals.joblib import Parallel, delayed
+from sklearn.utils import check_random_state
+
+TREE_LEAF = -1
+TREE_UNDEFINED = -2
+### at most this many (node, bin, class) histogram cells are held at once
+HISTOGRAM_CELLS = 2 ** 21
+
+
+class QuantileBinner(object):
+    """ per-feature bin edges at the quantiles of the data
+
+        a value x falls into bin b when edges[b - 1] < x <= edges[b], so
+        "bin <= b" is the same test as "x <= edges[b]". features with at
+        most max_bins distinct values get one bin per value; NaN goes to
+        the last bin
+    """
+
+    def __init__(self, max_bins=256):
+        if not 2 <= max_bins <= 256:
+            raise ValueError("max_bins must be between 2 and 256, got %r" % max_bins)
+        self.max_bins = max_bins
+        self.edges = None
+
+    def fit(self, X):
+        X = numpy.asarray(X, dtype=numpy.float64)
+        percentiles = numpy.linspace(0, 100, self.max_bins + 1)[1:-1]
+        self.edges = []
+        for column in X.T:
+            column = column[~numpy.isnan(column)]
+            distinct = numpy.unique(column)
+            if len(distinct) <= self.max_bins:
+                edges = (distinct[:-1] + distinct[1:]) / 2.0
+            else:
+                edges = numpy.unique(numpy.percentile(column, percentiles))
+            self.edges.append(edges)
+        return self
+
+    def is_fitted(self):
+        return self.edges is not None
+
+    @property
+    def n_bins(self):
+        return numpy.array([len(edges) + 1 for edges in self.edges])
+
+    def transform(self, X):
+        """ rows x features uint8 bin numbers, in Fortran order """
+        X = numpy.asarray(X, dtype=numpy.float64)
+        if X.shape[1] != len(self.edges):
+            raise ValueError("binner was fitted on %d features, got %d" % (len(self.edges), X.shape[1]))
+        binned = numpy.empty(X.shape, dtype=numpy.uint8, order="F")
+        for ii, edges in enumerate(self.edges):
+            binned[:, ii] = numpy.searchsorted(edges, X[:, ii], side="left")
+        return binned
+
+
+class HistTree(object):
+    """ one fitted tree, as parallel node arrays laid out like sklearn's
+        tree_: TREE_LEAF children and TREE_UNDEFINED feature/threshold at
+        leaves, value holds the (n_nodes, 1, n_classes) class counts
+    """
+
+    def __init__(self, children_left, children_right, feature, threshold, value):
+        self.children_left = children_left
+        self.children_right = children_right
+        self.feature = feature
+        self.threshold = threshold
+        self.value = value
+
+    @property
+    def node_count(self):
+        return len(self.children_left)
+
+    def apply(self, X):
+        """ the leaf each row of X ends up in """
+        node = numpy.zeros(len(X), dtype=numpy.intp)
+        rows = numpy.arange(len(X))
+        while len(rows):
+            current = node[rows]
+            internal = self.children_left[current] != TREE_LEAF
+            rows, current = rows[internal], current[internal]
+            go_left = X[rows, self.feature[current]] <= self.threshold[current]
+            node[rows] = numpy.where(go_left, self.children_left[current], self.children_right[current])
+        return node
+
+    def predict_proba(self, X):
+        counts = self.value[self.apply(X), 0]
+        return counts / counts.sum(axis=1)[:, numpy.newaxis]
+
+    def feature_importances(self, n_features, criterion="gini"):
+        """ weighted impurity decrease per feature, normalised to sum to 1 """
+        counts = self.value[:, 0]
+        weighted = counts.sum(axis=1) * _impurity(counts, criterion)
+        internal = numpy.flatnonzero(self.children_left != TREE_LEAF)
+        decrease = (weighted[internal] - weighted[self.children_left[internal]] -
+                    weighted[self.children_right[internal]])
+        importances = numpy.bincount(self.feature[internal], weights=decrease, minlength=n_features)
+        total = importances.sum()
+        return importances / total if total > 0 else importances
+
+
+def _impurity(counts, criterion):
+    total = counts.sum(axis=-1)
+    proportions = counts / numpy.maximum(total, 1)[..., numpy.newaxis]
+    if criterion == "gini":
+        return 1.0 - (proportions ** 2).sum(axis=-1)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        return -numpy.where(proportions > 0, proportions * numpy.log2(proportions), 0.0).sum(axis=-1)
+
+
+def _split_scores(left, right, criterion, min_samples_leaf):
+    """ higher is better: minus the summed weighted impurity of the two
+        children, from their class counts along the last axis; -inf where
+        a child would have fewer than min_samples_leaf samples
+    """
+    scores = 0.0
+    for side in (left, right):
+        n = side.sum(axis=-1)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            if criterion == "gini":
+                scores = scores + numpy.where(n > 0, (side ** 2).sum(axis=-1) / n, 0.0)
+            else:
+                scores = scores + numpy.where(side > 0, side * numpy.log(side / n[..., numpy.newaxis]),
+                                              0.0).sum(axis=-1)
+        scores = numpy.where(n >= min_samples_leaf, scores, -numpy.inf)
+    return scores
+
+
+def _dense_splits(nodes, bins, classes, totals, width, n_classes, criterion, min_samples_leaf):
+    """ best (bin, score) per node from full (node, bin, class) histograms,
+        for few nodes with many samples each
+    """
+    best_bin = numpy.zeros(len(totals), dtype=numpy.intp)
+    best_score = numpy.full(len(totals), -numpy.inf)
+    chunk = max(1, HISTOGRAM_CELLS // (width * n_classes))
+    starts = numpy.searchsorted(nodes, numpy.arange(0, len(totals) + chunk, chunk))
+    for ii, first in enumerate(range(0, len(totals), chunk)):
+        last = min(first + chunk, len(totals))
+        rows = slice(starts[ii], starts[ii + 1])
+        cells = ((nodes[rows] - first) * width + bins[rows]) * n_classes + classes[rows]
+        histogram = numpy.bincount(cells, minlength=(last - first) * width * n_classes)
+        left = numpy.cumsum(histogram.reshape(last - first, width, n_classes), axis=1)[:, :-1]
+        left = left.astype(numpy.float64)
+        scores = _split_scores(left, totals[first:last, numpy.newaxis, :] - left, criterion, min_samples_leaf)
+        best_bin[first:last] = numpy.argmax(scores, axis=1)
+        best_score[first:last] = scores[numpy.arange(last - first), best_bin[first:last]]
+    return best_bin, best_score
+
+
+def _sparse_splits(nodes, bins, classes, totals, width, n_classes, criterion, min_samples_leaf):
+    """ best (bin, score) per node scoring only the bins that occur, for
+        many small nodes; every node must have samples
+    """
+    ### int32 keys sort noticeably faster than 64 bit ones
+    keys = (nodes * width + bins).astype(numpy.int32 if len(totals) * width < 2 ** 31 else numpy.int64)
+    order = numpy.argsort(keys)
+    keys = keys[order]
+    counts = numpy.zeros((len(keys), n_classes))
+    counts[numpy.arange(len(keys)), classes[order]] = 1
+    counts = numpy.cumsum(counts, axis=0)
+    ### the last sample of every (node, bin) group closes a candidate split
+    ends = numpy.flatnonzero(numpy.append(keys[1:] != keys[:-1], True))
+    end_nodes = keys[ends] // width
+    node_starts = numpy.searchsorted(keys, numpy.arange(len(totals)) * width)
+    before = numpy.vstack([numpy.zeros((1, n_classes)), counts])[node_starts]
+    left = counts[ends] - before[end_nodes]
+    scores = _split_scores(left, totals[end_nodes] - left, criterion, min_samples_leaf)
+    segments = numpy.searchsorted(end_nodes, numpy.arange(len(totals)))
+    best_score = numpy.maximum.reduceat(scores, segments)
+    ### first end reaching its node's best, i.e. the lowest bin
+    is_best = numpy.flatnonzero(scores == best_score[end_nodes])
+    best_nodes, first = numpy.unique(end_nodes[is_best], return_index=True)
+    best_bin = numpy.zeros(len(totals), dtype=numpy.intp)
+    best_bin[best_nodes] = keys[ends[is_best[first]]] % width
+    return best_bin, best_score
+
+
+def _best_splits(binned, y, sample, local, totals, n_classes, n_bins, candidates, min_samples_leaf, criterion):
+    """ (feature, bin) of the best split of every node of a level, and
+        whether it has one; samples must be sorted by their local node
+    """
+    n_nodes = len(totals)
+    best_score = numpy.full(n_nodes, -numpy.inf)
+    best_feature = numpy.zeros(n_nodes, dtype=numpy.intp)
+    best_bin = numpy.zeros(n_nodes, dtype=numpy.intp)
+    ### samples are sorted by node, so every node is a contiguous segment
+    node_starts = numpy.searchsorted(local, numpy.arange(n_nodes))
+    node_sizes = numpy.diff(numpy.append(node_starts, len(local)))
+    for feature in range(binned.shape[1]):
+        selected = numpy.flatnonzero(candidates[:, feature])
+        if n_bins[feature] < 2 or not len(selected):
+            continue
+        ### the segments of the nodes that drew this feature, renumbered 0..len(selected)-1
+        sizes = node_sizes[selected]
+        nodes = numpy.arange(len(selected)).repeat(sizes)
+        segment_offsets = numpy.cumsum(sizes) - sizes
+        rows = sample[numpy.arange(len(nodes)) + (node_starts[selected] - segment_offsets).repeat(sizes)]
+        width = int(n_bins[feature])
+        find_splits = _dense_splits if len(selected) * width <= len(rows) else _sparse_splits
+        bins, scores = find_splits(nodes, binned[rows, feature].astype(numpy.intp), y[rows], totals[selected], width,
+                                   n_classes, criterion, min_samples_leaf)
+        better = scores > best_score[selected]
+        best_score[selected[better]] = scores[better]
+        best_feature[selected[better]] = feature
+        best_bin[selected[better]] = bins[better]
+    return best_feature, best_bin, best_score > -numpy.inf
+
+
+def _partition(sample, local, go_right, n_nodes):
+    """ reorder samples sorted by node into samples sorted by child
+        (2 * node + go_right), keeping their order; returns both, O(rows)
+    """
+    child = 2 * local + go_right
+    sizes = numpy.bincount(child, minlength=2 * n_nodes)
+    child_starts = numpy.cumsum(sizes) - sizes
+    node_sizes = numpy.bincount(local, minlength=n_nodes)
+    node_starts = (numpy.cumsum(node_sizes) - node_sizes)[local]
+    ### rank of each sample among the samples of its child
+    before = [numpy.append(0, numpy.cumsum(go_right == side))[:-1] for side in (0, 1)]
+    rank = numpy.where(go_right, before[1] - before[1][node_starts], before[0] - before[0][node_starts])
+    position = child_starts[child] + rank
+    partitioned = numpy.empty_like(sample)
+    partitioned[position] = sample
+    children = numpy.empty_like(child)
+    children[position] = child
+    return partitioned, children
+
+
+def build_tree(binned, y, n_classes, edges, max_depth=None, min_samples_split=2, min_samples_leaf=1,
+               max_features=None, criterion="gini", bootstrap=True, random_state=None):
+    """ grow one tree on a binned matrix and 0..n_classes-1 labels y,
+        a level at a time
+    """
+    random = check_random_state(random_state)
+    n_samples, n_features = binned.shape
+    n_bins = numpy.array([len(feature_edges) + 1 for feature_edges in edges])
+    max_features = n_features if max_features is None else max_features
+    sample = random.randint(0, n_samples, n_samples) if bootstrap else numpy.arange(n_samples)
+    sample.sort()
+
+    ### per level: node arrays, and every sample's local node number
+    children_left, children_right, feature, threshold, value = [], [], [], [], []
+    local = numpy.zeros(len(sample), dtype=numpy.intp)
+    n_nodes = 1
+    first_node = 0
+    depth = 0
+    while n_nodes:
+        totals = numpy.bincount(local * n_classes + y[sample], minlength=n_nodes * n_classes)
+        totals = totals.reshape(n_nodes, n_classes).astype(numpy.float64)
+        sizes = totals.sum(axis=1)
+        splittable = ((sizes >= min_samples_split) & (sizes >= 2 * min_samples_leaf) &
+                      (totals.max(axis=1) < sizes))
+        if max_depth is not None and depth >= max_depth:
+            splittable[:] = False
+        split_feature = numpy.zeros(n_nodes, dtype=numpy.intp)
+        split_bin = numpy.zeros(n_nodes, dtype=numpy.intp)
+        has_split = numpy.zeros(n_nodes, dtype=bool)
+        if splittable.any():
+            ### only the samples of splittable nodes, renumbered
+            to_split = numpy.flatnonzero(splittable)
+            renumber = numpy.cumsum(splittable) - 1
+            keep = splittable[local]
+            ### max_features candidate features per node, drawn without replacement
+            draws = random.rand(len(to_split), n_features)
+            candidates = draws <= numpy.partition(draws, max_features - 1, axis=1)[:, max_features - 1:max_features]
+            found = _best_splits(binned, y, sample[keep], renumber[local[keep]], totals[to_split], n_classes,
+                                 n_bins, candidates, min_samples_leaf, criterion)
+            split_feature[to_split], split_bin[to_split], has_split[to_split] = found
+
+        next_first = first_node + n_nodes
+        left = numpy.full(n_nodes, TREE_LEAF, dtype=numpy.intp)
+        left[has_split] = next_first + 2 * numpy.arange(has_split.sum())
+        children_left.append(left)
+        children_right.append(numpy.where(has_split, left + 1, TREE_LEAF))
+        feature.append(numpy.where(has_split, split_feature, TREE_UNDEFINED))
+        level_threshold = numpy.full(n_nodes, TREE_UNDEFINED, dtype=numpy.float64)
+        for node in numpy.flatnonzero(has_split):
+            level_threshold[node] = edges[split_feature[node]][split_bin[node]]
+        threshold.append(level_threshold)
+        value.append(totals)
+
+        ### samples of the split nodes move on to the children, in node order
+        keep = has_split[local]
+        sample, local = sample[keep], (numpy.cumsum(has_split) - 1)[local[keep]]
+        go_right = (binned[sample, split_feature[has_split][local]] > split_bin[has_split][local]).astype(numpy.intp)
+        sample, local = _partition(sample, local, go_right, int(has_split.sum()))
+        first_node, n_nodes = next_first, 2 * int(has_split.sum())
+        depth += 1
+
+    return HistTree(numpy.concatenate(children_left), numpy.concatenate(children_right),
+                    numpy.concatenate(feature), numpy.concatenate(threshold),
+                    numpy.concatenate(value)[:, numpy.newaxis, :])
+
+
+class HistRandomForestClassifier(BaseEstimator, ClassifierMixin):
+    """ random forest on quantile-binned features; takes the
+        RandomForestClassifier parameters it has in common, plus max_bins
+        and binner (a QuantileBinner; binner_ is the binner itself when it
+        is fitted, otherwise a copy of it fitted on X)
+
+        with warm_start, fitting again only adds the trees needed to reach
+        n_estimators, binned with the bins of the first fit; on the same
+        data that is the same forest as fitting all the trees at once
+    """
+
+    def __init__(self, n_estimators=10, criterion="gini", max_depth=None, min_samples_split=2,
+                 min_samples_leaf=1, max_features="auto", bootstrap=True, max_bins=256, binner=None, n_jobs=1,
+                 random_state=None, warm_start=False):
+        self.n_estimators = n_estimators
+        self.criterion = criterion
+        self.max_depth = max_depth
+        self.min_samples_split = min_samples_split
+        self.min_samples_leaf = min_samples_leaf
+        self.max_features = max_features
+        self.bootstrap = bootstrap
+        self.max_bins = max_bins
+        self.binner = binner
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.warm_start = warm_start
+
+    def _max_features(self, n_features):
+        if self.max_features in ("auto", "sqrt"):
+            return max(1, int(numpy.sqrt(n_features)))
+        if self.max_features == "log2":
+            return max(1, int(numpy.log2(n_features)))
+        if self.max_features is None:
+            return n_features
+        if isinstance(self.max_features, float):
+            return max(1, int(self.max_features * n_features))
+        return self.max_features
+
+    def fit(self, X, y):
+        if self.criterion not in ("gini", "entropy"):
+            raise ValueError("criterion must be 'gini' or 'entropy', got %r" % self.criterion)
+        X = numpy.asarray(X, dtype=numpy.float64)
+        grown = list(self.estimators_) if self.warm_start and hasattr(self, "estimators_") else []
+        if len(grown) > self.n_estimators:
+            raise ValueError("n_estimators=%d must be at least the %d trees already fitted with warm_start"
+                             % (self.n_estimators, len(grown)))
+        classes, y = numpy.unique(y, return_inverse=True)
+        if grown and not numpy.array_equal(classes, self.classes_):
+            raise ValueError("warm_start cannot change the classes, fitted on %r" % list(self.classes_))
+        self.classes_ = classes
+        self.n_classes_ = len(self.classes_)
+        self.n_features_ = X.shape[1]
+        if not grown:
+            if self.binner is not None and self.binner.is_fitted():
+                self.binner_ = self.binner
+            else:
+                ### fitting self.binner itself would hand its bins to the next fit
+                self.binner_ = copy.deepcopy(self.binner or QuantileBinner(self.max_bins)).fit(X)
+        binned = self.binner_.transform(X)
+        max_features = self._max_features(self.n_features_)
+        random = check_random_state(self.random_state)
+        ### the seeds of the trees already grown are drawn and skipped
+        seeds = random.randint(numpy.iinfo(numpy.int32).max, size=self.n_estimators)[len(grown):]
+        self.estimators_ = grown + Parallel(n_jobs=self.n_jobs)(
+            delayed(build_tree)(binned, y, self.n_classes_, self.binner_.edges, self.max_depth,
+                                self.min_samples_split, self.min_samples_leaf, max_features, self.criterion,
+                                self.bootstrap, seed)
+            for seed in seeds)
+        return self
+
+    def predict_proba(self, X):
+        X = numpy.asarray(X, dtype=numpy.float64)
+        return sum(tree.predict_proba(X) for tree in self.estimators_) / len(self.estimators_)
+
+    def predict(self, X):
+        return self.classes_[numpy.argmax(self.predict_proba(X), axis=1)]
+
+    @property
+    def feature_importances_(self):
+        return sum(tree.feature_importances(self.n_features_, self.criterion)
+                   for tree in self.estimators_) / len(self.estimators_)
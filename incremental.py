@@ -0,0 +1,166 @@
+#!/usr/bin/python
+
+""" add new employee records to the saved dataset and classifier without
+    re-running poi_id.py
+
+        python incremental.py new_people.jsonl
+        python incremental.py new_people.csv --extra-trees 5 --drift-threshold 0.5
+
+    only the new records are converted and get their POI ratio features
+    computed; they are appended to the stored dataset, folded into the
+    running statistics (count, NaN rate, mean, variance, quantiles) and
+    the classifier grows extra_trees more trees with warm_start, fitted on
+    all the rows. when the statistics of the model's features have drifted
+    from the ones at the last full build by more than drift_threshold
+    reference standard deviations, or the forest would grow beyond
+    max_trees, the classifier is rebuilt from scratch instead
+
+    works with any classifier that has warm_start and n_estimators, such as
+    RandomForestClassifier or HistRandomForestClassifier. records are read
+    like the input of score.py; my_dataset_stats.json keeps the statistics
+    between runs. the saved dataset is my_dataset.pkl, or my_dataset.bin
+    with --dataset-format binary
+"""
+
+import argparse
+import json
+import os
+
+import numpy
+from sklearn.base import clone
+
+from feature_engineering import POI_RATIO_FEATURES, store_from_records
+from feature_store import FeatureStore, get_feature_store, load_feature_store
+from score import detect_format, read_csv, read_jsonl
+from shards import sorted_records
+from stats import RunningStats
+from tester import DATASET_BINARY_FILENAME, dump_classifier_and_data, labels_and_features, load_classifier_and_data
+
+STATS_FILENAME = "my_dataset_stats.json"
+UPDATE_FORMAT_STRING = "Added {:d} records ({:d} in total), drift {:0.3f}: {}"
+
+
+def new_rows(store, records, chunk_size=1000):
+    """ a store of just the new (name, record) pairs, with the features of
+        store; the POI ratios are computed from their raw email counts
+    """
+    raw_features = [feature for feature in store.features if feature not in POI_RATIO_FEATURES]
+    rows = store_from_records(records, raw_features, chunk_size)
+    indices = rows.column_indices(store.features)
+    return FeatureStore(rows.keys, store.features, numpy.asfortranarray(rows.matrix[:, indices]),
+                        numpy.asfortranarray(rows.nan_mask[:, indices]))
+
+
+def drift(reference, current, features):
+    """ largest shift of a feature's mean, in reference standard
+        deviations; features without a reference spread are skipped
+    """
+    columns = [reference.features.index(feature) for feature in features]
+    spread = numpy.sqrt(reference.variance()[columns])
+    shift = numpy.abs(current.mean[columns] - reference.mean[columns])
+    defined = spread > 0
+    return float((shift[defined] / spread[defined]).max()) if defined.any() else 0.0
+
+
+class UpdateState(object):
+    """ what an update needs from earlier runs: the running statistics of
+        every row, the statistics at the last full build and the number of
+        trees the classifier had then
+    """
+
+    def __init__(self, stats, reference, base_estimators):
+        self.stats = stats
+        self.reference = reference
+        self.base_estimators = base_estimators
+
+    @classmethod
+    def from_store(cls, store, clf):
+        return cls(RunningStats.from_store(store), RunningStats.from_store(store), clf.n_estimators)
+
+    @classmethod
+    def load(cls, filename=STATS_FILENAME):
+        with open(filename, "r") as infile:
+            state = json.load(infile)
+        return cls(RunningStats.from_dict(state["stats"]), RunningStats.from_dict(state["reference"]),
+                   state["base_estimators"])
+
+    def dump(self, filename=STATS_FILENAME):
+        with open(filename, "w") as outfile:
+            json.dump({"stats": self.stats.to_dict(), "reference": self.reference.to_dict(),
+                       "base_estimators": self.base_estimators}, outfile)
+
+
+def update(clf, store, feature_list, records, state, extra_trees=5, max_trees=100, drift_threshold=0.5,
+           rebuild=None):
+    """ append records to store and refresh clf
+
+        returns (clf, store, report); state is updated in place. rebuild,
+        if given, is called as rebuild(store) -> (clf, feature_list) for a
+        full rebuild, e.g. to re-run feature selection and tuning; by
+        default the classifier is refitted from a clone with its original
+        number of trees
+    """
+    rows = new_rows(store, records)
+    store = store.append(rows)
+    state.stats.update(numpy.where(rows.nan_mask, numpy.nan, rows.matrix))
+    shift = drift(state.reference, state.stats, feature_list[1:])
+    labels, features = labels_and_features(store, feature_list)
+    rebuilt = True
+    if shift > drift_threshold:
+        action = "drift above %g, rebuilt" % drift_threshold
+    elif clf.n_estimators + extra_trees > max_trees:
+        action = "more than %d trees, rebuilt" % max_trees
+    else:
+        rebuilt = False
+        clf.set_params(warm_start=True, n_estimators=clf.n_estimators + extra_trees)
+        clf.fit(features, labels)
+        clf.set_params(warm_start=False)
+        action = "added %d trees, %d in total" % (extra_trees, clf.n_estimators)
+    if rebuilt:
+        if rebuild is not None:
+            clf, feature_list = rebuild(store)
+        else:
+            clf = clone(clf).set_params(warm_start=False, n_estimators=state.base_estimators)
+            clf.fit(features, labels)
+        state.reference = RunningStats.from_dict(state.stats.to_dict())
+        state.base_estimators = clf.n_estimators
+    report = {"added": len(rows), "rows": len(store), "drift": shift, "action": action,
+              "feature_list": feature_list}
+    return clf, store, report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Add new records to the saved dataset and classifier.")
+    parser.add_argument("input", help="JSON lines or CSV file of new records, or a directory of shards")
+    parser.add_argument("--format", dest="input_format", default="auto", choices=["auto", "jsonl", "csv", "shards"])
+    parser.add_argument("--name-field", default="name")
+    parser.add_argument("--extra-trees", type=int, default=5)
+    parser.add_argument("--max-trees", type=int, default=100)
+    parser.add_argument("--drift-threshold", type=float, default=0.5)
+    parser.add_argument("--dataset-format", default="pickle", choices=["pickle", "binary"],
+                        help="saved dataset to read and rewrite, default %(default)s")
+    args = parser.parse_args(argv)
+
+    input_format = detect_format(args.input) if args.input_format == "auto" else args.input_format
+    if input_format == "binary":
+        parser.error("new records must be JSON lines, CSV or shards")
+    read = {"csv": read_csv, "jsonl": read_jsonl, "shards": sorted_records}[input_format]
+
+    clf, dataset, feature_list = load_classifier_and_data(args.dataset_format)
+    if isinstance(dataset, FeatureStore):
+        ### the binary file is rewritten below, so read it instead of mapping it
+        dataset = load_feature_store(DATASET_BINARY_FILENAME, mmap_mode=None)
+    store = get_feature_store(dataset)
+    state = UpdateState.load() if os.path.exists(STATS_FILENAME) else None
+    if state is None or state.stats.rows != len(store):
+        ### no statistics yet, or the dataset was rebuilt by poi_id.py since
+        state = UpdateState.from_store(store, clf)
+    clf, store, report = update(clf, store, feature_list, read(args.input, args.name_field), state,
+                                args.extra_trees, args.max_trees, args.drift_threshold)
+    dump_classifier_and_data(clf, store, report["feature_list"], dataset_format=args.dataset_format)
+    state.dump()
+    print UPDATE_FORMAT_STRING.format(report["added"], report["rows"], report["drift"], report["action"])
+
+
+if __name__ == '__main__':
+    main()
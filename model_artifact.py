@@ -0,0 +1,191 @@
+#!/usr/bin/python
+
+""" a versioned binary file for fitted tree ensembles, loaded without
+    pickle or sklearn
+
+        dump_model(clf, feature_list, "my_classifier.model", dataset)
+        model = load_model("my_classifier.model")
+        model.predict_proba(features)
+
+    the nodes of every tree are concatenated into flat typed arrays, so
+    loading a model memory-maps them and reads only the JSON manifest:
+        8 bytes   magic, "POIMODEL"
+        8 bytes   little-endian uint64, length of the JSON manifest
+        manifest  JSON: version, estimator, classes, feature_list, digest
+                  (dataset_hash of the training data), source (sha1 of the
+                  pickled classifier it was written with, if any),
+                  input_dtype and the dtype, shape and offset of every array
+        arrays    little-endian, each on a 64 byte boundary:
+                  children_left, children_right, feature  int32, per node
+                  threshold                               float64, per node
+                  value      float64, nodes x classes, class probabilities
+                  roots      int64, first node of every tree
+    child indices are global, TREE_LEAF at leaves
+
+    DecisionTreeClassifier, RandomForestClassifier, ExtraTreesClassifier
+    and HistRandomForestClassifier are supported; predict_proba gives the
+    same probabilities as the estimator's own
+"""
+
+import json
+import struct
+
+import numpy
+
+from feature_store import _aligned, get_feature_store
+
+MODEL_MAGIC = "POIMODEL"
+MODEL_VERSION = 1
+TREE_LEAF = -1
+
+ARRAY_DTYPES = [("children_left", "<i4"), ("children_right", "<i4"), ("feature", "<i4"),
+                ("threshold", "<f8"), ("value", "<f8"), ("roots", "<i8")]
+
+
+def _trees(clf):
+    """ the trees of clf, each with sklearn's tree_ arrays, and the dtype
+        its thresholds compare the input in; None when clf is not a
+        supported tree ensemble
+    """
+    if hasattr(clf, "tree_"):
+        return [clf.tree_], "float32"
+    estimators = getattr(clf, "estimators_", None)
+    if not isinstance(estimators, list) or not estimators:
+        return None
+    if all(hasattr(tree, "tree_") for tree in estimators):
+        ### sklearn trees compare float32 features with float64 thresholds
+        return [tree.tree_ for tree in estimators], "float32"
+    if all(hasattr(tree, "children_left") for tree in estimators):
+        return estimators, "float64"
+    return None
+
+
+def supports(clf):
+    """ whether clf is a fitted, single-output tree classifier dump_model can write """
+    trees = _trees(clf)
+    return (trees is not None and hasattr(clf, "classes_") and numpy.ndim(clf.classes_) == 1 and
+            getattr(clf, "n_outputs_", 1) == 1)
+
+
+def dump_model(clf, feature_list, filename, dataset=None, source=None):
+    """ write clf in the format described at the top of this module
+
+        dataset, a dict or FeatureStore, is the training data whose hash
+        goes into the manifest; source, the sha1 of the pickle clf was
+        also written to, tells readers which pickle the model stands for
+    """
+    if not supports(clf):
+        raise ValueError("cannot write a %s as a model artifact" % type(clf).__name__)
+    trees, input_dtype = _trees(clf)
+    roots = numpy.cumsum([0] + [len(tree.children_left) for tree in trees[:-1]])
+    arrays = {"roots": roots}
+    for name in ("children_left", "children_right", "feature", "threshold"):
+        arrays[name] = numpy.concatenate([getattr(tree, name) for tree in trees])
+    for name, offsets in (("children_left", roots), ("children_right", roots)):
+        ### node indices become positions in the concatenated arrays
+        shift = numpy.repeat(offsets, [len(tree.children_left) for tree in trees])
+        arrays[name] = numpy.where(arrays[name] == TREE_LEAF, TREE_LEAF, arrays[name] + shift)
+    value = numpy.concatenate([tree.value[:, 0] for tree in trees]).astype(numpy.float64)
+    normalizer = value.sum(axis=1)
+    normalizer[normalizer == 0] = 1.0
+    arrays["value"] = value / normalizer[:, numpy.newaxis]
+
+    classes = numpy.asarray(clf.classes_)
+    manifest = {"version": MODEL_VERSION, "estimator": type(clf).__name__, "classes": classes.tolist(),
+                "classes_dtype": classes.dtype.str, "feature_list": list(feature_list),
+                "digest": get_feature_store(dataset).digest if dataset is not None else None,
+                "source": source, "input_dtype": input_dtype, "n_estimators": len(trees), "arrays": {}}
+    ### the offsets are part of the manifest, so size it with placeholders first
+    for name, dtype in ARRAY_DTYPES:
+        manifest["arrays"][name] = {"dtype": dtype, "shape": list(arrays[name].shape), "offset": 0}
+    offset = _aligned(len(MODEL_MAGIC) + 8 + len(json.dumps(manifest)) + 64 * len(ARRAY_DTYPES))
+    start = offset
+    for name, dtype in ARRAY_DTYPES:
+        manifest["arrays"][name]["offset"] = offset
+        offset = _aligned(offset + arrays[name].size * numpy.dtype(dtype).itemsize)
+    encoded = json.dumps(manifest)
+    encoded += " " * (start - len(MODEL_MAGIC) - 8 - len(encoded))
+    with open(filename, "wb") as outfile:
+        outfile.write(MODEL_MAGIC)
+        outfile.write(struct.pack("<Q", len(encoded)))
+        outfile.write(encoded)
+        for name, dtype in ARRAY_DTYPES:
+            outfile.write("\0" * (manifest["arrays"][name]["offset"] - outfile.tell()))
+            outfile.write(numpy.ascontiguousarray(arrays[name], dtype=dtype).tostring())
+
+
+def read_manifest(filename):
+    """ the JSON manifest of a model file, without touching the arrays """
+    with open(filename, "rb") as infile:
+        if infile.read(len(MODEL_MAGIC)) != MODEL_MAGIC:
+            raise ValueError("%s is not a model file" % filename)
+        manifest_length, = struct.unpack("<Q", infile.read(8))
+        manifest = json.loads(infile.read(manifest_length))
+    if manifest["version"] != MODEL_VERSION:
+        raise ValueError("unsupported model version %s in %s" % (manifest["version"], filename))
+    return manifest
+
+
+class ForestModel(object):
+    """ a tree ensemble read back by load_model, with the predict and
+        predict_proba of the estimator it was written from
+
+        classes_, feature_list, digest and n_estimators come from the
+        manifest; the node arrays are attributes named as in the file
+    """
+
+    def __init__(self, manifest, arrays):
+        self.manifest = manifest
+        self.classes_ = numpy.array(manifest["classes"], dtype=manifest["classes_dtype"])
+        self.feature_list = manifest["feature_list"]
+        self.digest = manifest["digest"]
+        self.n_estimators = manifest["n_estimators"]
+        self.input_dtype = numpy.dtype(manifest["input_dtype"])
+        for name, array in arrays.items():
+            setattr(self, name, array)
+
+    def apply(self, X):
+        """ rows x trees, the leaf (global node index) of every row in every tree """
+        X = numpy.asarray(X, dtype=self.input_dtype)
+        n_trees = len(self.roots)
+        node = numpy.tile(self.roots, len(X))
+        row = numpy.repeat(numpy.arange(len(X)), n_trees)
+        active = numpy.arange(len(node))
+        while len(active):
+            current = node[active]
+            internal = self.children_left[current] != TREE_LEAF
+            active, current = active[internal], current[internal]
+            go_left = X[row[active], self.feature[current]] <= self.threshold[current]
+            node[active] = numpy.where(go_left, self.children_left[current], self.children_right[current])
+        return node.reshape(len(X), n_trees)
+
+    def predict_proba(self, X):
+        leaves = self.apply(X)
+        ### summed tree by tree, in the order the estimators average them
+        proba = numpy.zeros((len(leaves), len(self.classes_)))
+        for tree in range(leaves.shape[1]):
+            proba += self.value[leaves[:, tree]]
+        return proba / leaves.shape[1]
+
+    def predict(self, X):
+        return self.classes_[numpy.argmax(self.predict_proba(X), axis=1)]
+
+
+def load_model(filename, mmap_mode="r"):
+    """ open a model written by dump_model
+
+        the node arrays are memory-mapped; mmap_mode=None reads them into
+        memory instead
+    """
+    manifest = read_manifest(filename)
+    arrays = {}
+    for name, dtype in ARRAY_DTYPES:
+        spec = manifest["arrays"][name]
+        shape = tuple(spec["shape"])
+        if mmap_mode is None or 0 in shape:
+            with open(filename, "rb") as infile:
+                infile.seek(spec["offset"])
+                arrays[name] = numpy.fromfile(infile, dtype=dtype, count=int(numpy.prod(shape))).reshape(shape)
+        else:
+            arrays[name] = numpy.memmap(filename, dtype=dtype, mode=mmap_mode, offset=spec["offset"], shape=shape)
+    return ForestModel(manifest, arrays)
@@ -0,0 +1,87 @@
+#!/usr/bin/python
+
+""" automatic outlier checks over the numeric matrix of a dataset
+
+        report = outlier_report(get_feature_store(data_dict))
+        print_outlier_report(report)
+        df.drop(report["drop"], inplace=True)
+
+    every record gets four vectorised checks:
+        empty      no value for any feature (dropped)
+        aggregate  every value it has equals the sum of that column over
+                   all other records, like the TOTAL line of a
+                   spreadsheet (dropped)
+        sparse     fewer than min_values values (reported)
+        extreme    some value outside the lower/upper quantiles of its
+                   feature (reported, with the features)
+
+    the store is read twice, chunk_size rows at a time: once for the
+    column sums and the quantiles, which come from the single pass
+    quantile sketches of stats.RunningStats (exact up to 2048 values per
+    feature), and once to check the rows
+"""
+
+import numpy
+
+from stats import RunningStats
+
+CHECKS = ("empty", "aggregate", "sparse", "extreme")
+OUTLIER_FORMAT_STRING = "\t{:>36s}\t{:<22s}\t{}"
+
+
+def _chunks(store, indices, chunk_size):
+    for start in range(0, len(store), chunk_size):
+        rows = slice(start, start + chunk_size)
+        yield start, numpy.where(store.nan_mask[rows, indices], numpy.nan, store.matrix[rows, indices])
+
+
+def outlier_report(store, features=None, label="poi", lower_quantile=0.01, upper_quantile=0.99, min_values=3,
+                   drop=("empty", "aggregate"), rtol=1e-9, chunk_size=100000):
+    """ check every record of a FeatureStore on features (all but label by
+        default)
+
+        returns a dict: "drop", the names failing a check in drop;
+        "flagged", one {"name", "checks", "features"} dict per record
+        failing any check, "features" naming the extreme ones; and
+        "lower"/"upper", the quantiles per feature
+    """
+    if features is None:
+        features = [feature for feature in store.features if feature != label]
+    indices = store.column_indices(features)
+    stats = RunningStats(features)
+    sums = numpy.zeros(len(features))
+    for start, values in _chunks(store, indices, chunk_size):
+        stats.update(values)
+        sums += numpy.where(numpy.isnan(values), 0.0, values).sum(axis=0)
+    lower, upper = stats.quantile(lower_quantile), stats.quantile(upper_quantile)
+
+    flagged = []
+    for start, values in _chunks(store, indices, chunk_size):
+        present = ~numpy.isnan(values)
+        counts = present.sum(axis=1)
+        ### a row equal to the sum of the others is half the sum over all rows
+        with numpy.errstate(invalid="ignore"):
+            matches = numpy.isclose(2 * values, sums, rtol=rtol, atol=0) & present
+            high, low = values > upper, values < lower
+        failed = {"empty": counts == 0,
+                  "aggregate": (counts >= 2) & (matches.sum(axis=1) == counts),
+                  "sparse": (counts > 0) & (counts < min_values),
+                  "extreme": (high | low).any(axis=1)}
+        any_failed = numpy.zeros(len(values), dtype=bool)
+        for check in CHECKS:
+            any_failed |= failed[check]
+        for row in numpy.flatnonzero(any_failed):
+            flagged.append({"name": store.keys[start + row],
+                            "checks": [check for check in CHECKS if failed[check][row]],
+                            "features": [features[ii] for ii in numpy.flatnonzero(high[row] | low[row])]})
+    return {"drop": [row["name"] for row in flagged if set(row["checks"]).intersection(drop)],
+            "flagged": flagged, "lower": dict(zip(features, lower)), "upper": dict(zip(features, upper))}
+
+
+def print_outlier_report(report, checks=CHECKS):
+    """ one line per flagged record failing one of checks, dropped ones marked """
+    dropped = set(report["drop"])
+    for row in report["flagged"]:
+        if set(row["checks"]).intersection(checks):
+            name = row["name"] + (" (drop)" if row["name"] in dropped else "")
+            print OUTLIER_FORMAT_STRING.format(name, ", ".join(row["checks"]), ", ".join(row["features"]))
@@ -0,0 +1,130 @@
+#!/usr/bin/python
+
+""" per-fold, per-stage timing for tester.test_classifier
+
+        profiler = FoldProfiler()
+        test_classifier(clf, dataset, feature_list, profiler=profiler)
+        profiler.to_csv("folds.csv")
+
+    every fold is split into the stages of the fold loop: split (drawing
+    the fold indices), slice (indexing the train/test rows), fit,
+    predict and tally (the confusion counts). each sample records the
+    wall time and the change in resident memory over the stage. with no
+    profiler passed, test_classifier runs the plain loop
+"""
+
+import csv
+import json
+import os
+import resource
+import time
+
+STAGES = ("split", "slice", "fit", "predict", "tally")
+FIELDS = ("fold", "stage", "seconds", "rss_delta_kb")
+SUMMARY_HEADER = "\t{:>8s}\t{:>6s}\t{:>10s}\t{:>10s}\t{:>10s}\t{:>7s}\t{:>14s}".format(
+    "stage", "folds", "total s", "mean ms", "max ms", "share", "mean rss kB")
+SUMMARY_FORMAT_STRING = "\t{:>8s}\t{:>6d}\t{:>10.3f}\t{:>10.3f}\t{:>10.3f}\t{:>7.1%}\t{:>14.1f}"
+
+_PAGE_KB = os.sysconf("SC_PAGE_SIZE") / 1024.0 if hasattr(os, "sysconf") else 4.0
+
+
+def resident_kb():
+    """ current resident set size, or the peak where /proc is not available """
+    try:
+        with open("/proc/self/statm", "r") as statm:
+            return int(statm.read().split()[1]) * _PAGE_KB
+    except (IOError, OSError):
+        return float(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+class _StageTimer(object):
+    __slots__ = ("profiler", "fold", "stage", "start", "rss")
+
+    def __init__(self, profiler, fold, stage):
+        self.profiler = profiler
+        self.fold = fold
+        self.stage = stage
+
+    def __enter__(self):
+        self.rss = resident_kb() if self.profiler.memory else 0.0
+        self.start = time.time()
+
+    def __exit__(self, *exc_info):
+        elapsed = time.time() - self.start
+        rss_delta = resident_kb() - self.rss if self.profiler.memory else 0.0
+        self.profiler.samples.append((self.fold, self.stage, elapsed, rss_delta))
+        return False
+
+
+class FoldProfiler(object):
+    """ collects (fold, stage, seconds, rss_delta_kb) samples """
+
+    def __init__(self, memory=True):
+        self.memory = memory
+        self.samples = []
+
+    def stage(self, fold, stage):
+        """ context manager timing one stage of one fold """
+        return _StageTimer(self, fold, stage)
+
+    def iter_splits(self, cv, first_fold=0):
+        """ iterate over cv, timing how long each split takes to draw """
+        cv = iter(cv)
+        fold = first_fold
+        while True:
+            with self.stage(fold, "split"):
+                try:
+                    split = next(cv)
+                except StopIteration:
+                    split = None
+            if split is None:
+                ### drawing nothing is not a fold
+                self.samples.pop()
+                return
+            yield fold, split
+            fold += 1
+
+    def spawn(self):
+        """ an empty profiler of the same kind, for a process pool worker """
+        return FoldProfiler(self.memory)
+
+    def merge(self, samples):
+        self.samples.extend(samples)
+
+    def summary(self):
+        """ one dict per stage: folds, total and mean/max seconds, share of
+            the total time and mean rss delta
+        """
+        total = sum(sample[2] for sample in self.samples) or 1.0
+        rows = []
+        for stage in STAGES:
+            samples = [sample for sample in self.samples if sample[1] == stage]
+            if not samples:
+                continue
+            seconds = [sample[2] for sample in samples]
+            rows.append({"stage": stage, "folds": len(samples), "total_s": sum(seconds),
+                         "mean_s": sum(seconds) / len(seconds), "max_s": max(seconds),
+                         "share": sum(seconds) / total,
+                         "mean_rss_delta_kb": sum(sample[3] for sample in samples) / len(samples)})
+        return rows
+
+    def print_summary(self):
+        print SUMMARY_HEADER
+        for row in self.summary():
+            print SUMMARY_FORMAT_STRING.format(row["stage"], row["folds"], row["total_s"], row["mean_s"] * 1000,
+                                               row["max_s"] * 1000, row["share"], row["mean_rss_delta_kb"])
+
+    def sorted_samples(self):
+        """ samples by fold, then in stage order """
+        return sorted(self.samples, key=lambda sample: (sample[0], STAGES.index(sample[1])))
+
+    def to_csv(self, filename):
+        with open(filename, "wb") as outfile:
+            writer = csv.writer(outfile)
+            writer.writerow(FIELDS)
+            writer.writerows(self.sorted_samples())
+
+    def to_json(self, filename):
+        with open(filename, "w") as outfile:
+            json.dump({"samples": [dict(zip(FIELDS, sample)) for sample in self.sorted_samples()],
+                       "summary": self.summary()}, outfile, indent=2)
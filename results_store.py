@@ -0,0 +1,238 @@
+#!/usr/bin/python
+
+""" a local store of tester evaluations, so that an unchanged model is
+    never evaluated twice
+
+        results = ResultsStore()
+        record = results.evaluate(clf, my_dataset, my_feature_list)
+        test_classifier(clf, my_dataset, my_feature_list, results=results)
+
+    every evaluation is keyed on a sha1 of the classifier's class and
+    parameters (deep, random_state included, written with
+    tuning.param_state so the key is the same in every process), the
+    feature list, the dataset digest and the fold settings (folds, seed,
+    tolerance); a key already in the store returns its record at once.
+    records hold the confusion counts, metrics, seconds taken and when
+    they were made, and are appended to evaluation_results.jsonl
+
+    a random_state of None (the classifier's own or a nested estimator's)
+    would give different counts on every run, so it is set to the fold
+    seed, 42, in the clone that is evaluated, and the key is that of the
+    seeded classifier; record["seeded"] names the parameters set. a
+    classifier with a parameter param_state cannot write has no stable
+    key, and is evaluated with a warning and never stored
+
+        python results_store.py list [--classifier RandomForestClassifier]
+        python results_store.py diff 3f2a9c 81be07
+
+    list prints past runs, oldest first; diff compares two of them by key
+    or key prefix: parameters, features, dataset and metrics
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+import warnings
+
+from sklearn.base import clone
+
+from feature_store import dataset_digest
+from tester import FOLD_SEED, evaluate_classifier, performance_metrics
+from tuning import param_state
+
+RESULTS_FILENAME = "evaluation_results.jsonl"
+RUNS_HEADER = "\t{:<10s}\t{:<19s}\t{:<24s}\t{:>9s}\t{:>9s}\t{:>9s}\t{:>9s}\t{:>9s}".format(
+    "key", "created", "classifier", "Precision", "Recall", "F1", "F2", "seconds")
+RUNS_FORMAT_STRING = "\t{:<10s}\t{:<19s}\t{:<24s}\t{:>9s}\t{:>9s}\t{:>9s}\t{:>9s}\t{:>9.2f}"
+DIFF_FORMAT_STRING = "\t{:>28s}\t{:>20s}\t{:>20s}"
+
+
+def json_params(clf):
+    """ param_state of clf.get_params(deep=True); a TypeError when a
+        parameter has no stable JSON form
+    """
+    return param_state(clf.get_params(deep=True))
+
+
+def seed_random_states(clf, seed=FOLD_SEED):
+    """ clf, or a clone of it with every random_state of None (nested
+        estimators' included) set to seed, and the names of the
+        parameters set
+    """
+    unset = sorted(name for name, value in clf.get_params(deep=True).items()
+                   if (name == "random_state" or name.endswith("__random_state")) and value is None)
+    if not unset:
+        return clf, []
+    return clone(clf).set_params(**dict((name, seed) for name in unset)), unset
+
+
+def evaluation_key(clf, feature_list, digest, folds=1000, seed=FOLD_SEED, tolerance=None, check_every=50,
+                   params=None):
+    """ sha1 over everything that determines an evaluation's counts
+
+        params, json_params(clf) when not given
+    """
+    if params is None:
+        params = json_params(clf)
+    description = [type(clf).__module__, type(clf).__name__, sorted(params.items()), list(feature_list),
+                   digest, folds, seed, tolerance, check_every if tolerance is not None else None]
+    return hashlib.sha1(json.dumps(description, sort_keys=True)).hexdigest()
+
+
+class ResultsStore(object):
+    """ append-only JSON lines file of evaluation records, in the order
+        they were made
+    """
+
+    def __init__(self, filename=RESULTS_FILENAME):
+        self.filename = filename
+        self.records = []
+        self._keys = {}
+        if os.path.exists(filename):
+            with open(filename, "r") as results_file:
+                for line in results_file:
+                    if line.strip():
+                        self._add(json.loads(line))
+
+    def _add(self, record):
+        self._keys[record["key"]] = len(self.records)
+        self.records.append(record)
+
+    def get(self, key):
+        """ the record with key, or with the only key starting with it """
+        if key in self._keys:
+            return self.records[self._keys[key]]
+        matches = [stored for stored in self._keys if stored.startswith(key)]
+        if len(matches) > 1:
+            raise KeyError("key prefix %s matches %d results" % (key, len(matches)))
+        return self.records[self._keys[matches[0]]] if matches else None
+
+    def put(self, record):
+        self._add(record)
+        with open(self.filename, "a") as results_file:
+            results_file.write(json.dumps(record, sort_keys=True) + "\n")
+
+    def evaluate(self, clf, dataset, feature_list, folds=1000, n_jobs=1, tolerance=None, check_every=50,
+                 seed=FOLD_SEED):
+        """ the record of evaluate_classifier with these arguments, from the
+            store when it holds one, otherwise evaluated and stored
+
+            record["cached"] tells which; n_jobs does not change the counts
+            and is not part of the key. a random_state of None is set to
+            seed first (see seed_random_states); a classifier without a
+            stable key is evaluated with a warning and not stored
+            (record["key"] is None)
+        """
+        digest = dataset_digest(dataset)
+        clf, seeded = seed_random_states(clf, seed)
+        try:
+            params = json_params(clf)
+        except TypeError as e:
+            warnings.warn("not caching the evaluation of %s: %s" % (type(clf).__name__, e))
+            params = key = None
+        else:
+            key = evaluation_key(clf, feature_list, digest, folds, seed, tolerance, check_every, params)
+        record = self.get(key) if key in self._keys else None
+        if record is not None:
+            return dict(record, cached=True, seeded=seeded)
+        start = time.time()
+        counts = evaluate_classifier(clf, dataset, feature_list, folds, n_jobs, tolerance, check_every, seed=seed)
+        seconds = time.time() - start
+        try:
+            metrics = performance_metrics(counts["true_positives"], counts["false_positives"],
+                                          counts["false_negatives"], counts["true_negatives"])
+        except ZeroDivisionError:
+            metrics = {}
+        record = {"key": key, "classifier": type(clf).__name__, "params": params,
+                  "feature_list": list(feature_list), "dataset": digest, "folds": folds, "seed": seed,
+                  "tolerance": tolerance, "counts": counts, "metrics": metrics, "seconds": seconds,
+                  "seeded": seeded, "created": time.strftime("%Y-%m-%d %H:%M:%S")}
+        if key is not None:
+            self.put(record)
+        return dict(record, cached=False)
+
+    def query(self, classifier=None, dataset=None, feature_list=None, **params):
+        """ records, oldest first, of the classifier class name, dataset
+            digest and feature list given, whose params equal the ones given
+        """
+        return [record for record in self.records
+                if (classifier is None or record["classifier"] == classifier) and
+                (dataset is None or record["dataset"] == dataset) and
+                (feature_list is None or record["feature_list"] == list(feature_list)) and
+                all(record["params"].get(name) == value for name, value in params.items())]
+
+    def diff(self, key_a, key_b):
+        """ what differs between two records: a dict with "params" and
+            "metrics" ({name: (a, b)}), "features_added" and
+            "features_removed" (from a to b), and "settings" for the
+            classifier, dataset, folds, seed and tolerance
+        """
+        records = []
+        for key in (key_a, key_b):
+            record = self.get(key)
+            if record is None:
+                raise KeyError("no result with key %s" % key)
+            records.append(record)
+        a, b = records
+
+        def changed(old, new):
+            return dict((name, (old.get(name), new.get(name))) for name in sorted(set(old) | set(new))
+                        if old.get(name) != new.get(name))
+
+        settings = dict((name, a.get(name)) for name in ("classifier", "dataset", "folds", "seed", "tolerance"))
+        return {"params": changed(a["params"], b["params"]),
+                "metrics": changed(a["metrics"], b["metrics"]),
+                "settings": changed(settings, dict((name, b.get(name)) for name in settings)),
+                "features_added": [feature for feature in b["feature_list"] if feature not in a["feature_list"]],
+                "features_removed": [feature for feature in a["feature_list"] if feature not in b["feature_list"]]}
+
+
+def _metric(record, name):
+    value = record["metrics"].get(name)
+    return "-" if value is None else "{:0.5f}".format(value)
+
+
+def print_runs(records):
+    print RUNS_HEADER
+    for record in records:
+        print RUNS_FORMAT_STRING.format(record["key"][:10], record["created"], record["classifier"],
+                                        _metric(record, "precision"), _metric(record, "recall"),
+                                        _metric(record, "f1"), _metric(record, "f2"), record["seconds"])
+
+
+def print_diff(difference):
+    for section in ("settings", "params", "metrics"):
+        for name, (old, new) in sorted(difference[section].items()):
+            print DIFF_FORMAT_STRING.format(name, str(old), str(new))
+    for feature in difference["features_added"]:
+        print DIFF_FORMAT_STRING.format(feature, "-", "added")
+    for feature in difference["features_removed"]:
+        print DIFF_FORMAT_STRING.format(feature, "removed", "-")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List and compare stored evaluation results.")
+    parser.add_argument("--results", default=RESULTS_FILENAME, help="results file, default %(default)s")
+    commands = parser.add_subparsers(dest="command")
+    listing = commands.add_parser("list", help="print past runs, oldest first")
+    listing.add_argument("--classifier", help="only runs of this classifier class")
+    listing.add_argument("--dataset", help="only runs on this dataset digest")
+    comparison = commands.add_parser("diff", help="compare two runs")
+    comparison.add_argument("key_a", help="key or key prefix")
+    comparison.add_argument("key_b", help="key or key prefix")
+    args = parser.parse_args(argv)
+
+    results = ResultsStore(args.results)
+    if args.command == "list":
+        print_runs(results.query(classifier=args.classifier, dataset=args.dataset))
+    else:
+        try:
+            print_diff(results.diff(args.key_a, args.key_b))
+        except KeyError as e:
+            parser.error(e.args[0])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/python
+
+""" batch scoring of new records with the classifier saved by poi_id.py
+
+    loads my_classifier.model, or my_classifier.pkl and my_feature_list.pkl
+    when there is no model artifact, once, then streams records from a
+    JSON lines, CSV or binary dataset file in fixed-size batches and
+    writes "name,poi_probability" rows as each batch is done, so memory
+    stays bounded by the batch size whatever the file size
+
+        python score.py new_people.jsonl -o scores.csv --batch-size 10000
+
+    JSON lines and CSV records hold a name (the --name-field column) and
+    the raw features; the POI email ratios are computed from the raw
+    email counts, and 'NaN', null, empty or missing values count as 0, as in
+    featureFormat. binary files are FeatureStore files (my_dataset.bin),
+    and a directory is read as the sorted shards of shards.py
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import numpy
+
+from feature_engineering import POI_RATIO_FEATURES, engineered_chunks, null_as_nan
+from feature_store import BINARY_MAGIC, load_feature_store
+from shards import sorted_records
+from tester import load_classifier_and_feature_list
+
+THROUGHPUT_FORMAT_STRING = "Scored {:d} rows in {:0.2f}s ({:0.0f} rows/s)"
+
+
+def detect_format(filename):
+    if os.path.isdir(filename):
+        return "shards"
+    with open(filename, "rb") as infile:
+        if infile.read(len(BINARY_MAGIC)) == BINARY_MAGIC:
+            return "binary"
+    return "csv" if filename.endswith(".csv") else "jsonl"
+
+
+def read_jsonl(filename, name_field="name"):
+    """ yield (name, record) for every non-empty line, with null read as 'NaN' """
+    with open(filename, "r") as infile:
+        for line in infile:
+            if line.strip():
+                record = json.loads(line)
+                yield record.pop(name_field), null_as_nan(record)
+
+
+def read_csv(filename, name_field="name"):
+    """ yield (name, record), with empty cells read as 'NaN' """
+    with open(filename, "rb") as infile:
+        for row in csv.DictReader(infile):
+            name = row.pop(name_field)
+            yield name, dict((feature, value if value != "" else "NaN") for feature, value in row.items())
+
+
+def record_batches(records, feature_list, batch_size):
+    """ (names, features) batches from (name, record) pairs, with the
+        columns of feature_list[1:] and NaN replaced by 0
+    """
+    features = feature_list[1:]
+    raw_features = [feature for feature in features if feature not in POI_RATIO_FEATURES]
+    columns = raw_features + POI_RATIO_FEATURES
+    selected = [columns.index(feature) for feature in features]
+    for names, matrix in engineered_chunks(records, raw_features, batch_size):
+        yield names, numpy.nan_to_num(matrix[:, selected])
+
+
+def store_batches(store, feature_list, batch_size):
+    """ (names, features) batches of rows of a FeatureStore, read from its
+        memory map one batch at a time
+    """
+    indices = store.column_indices(feature_list[1:])
+    for start in range(0, len(store), batch_size):
+        stop = min(start + batch_size, len(store))
+        values = numpy.where(store.nan_mask[start:stop, indices], 0.0, store.matrix[start:stop, indices])
+        yield store.keys[start:stop], values
+
+
+def positive_scores(clf, features):
+    """ probability of the POI class, or the hard prediction for
+        classifiers without predict_proba
+    """
+    if hasattr(clf, "predict_proba"):
+        probabilities = clf.predict_proba(features)
+        return probabilities[:, list(clf.classes_).index(1)]
+    return numpy.asarray(clf.predict(features), dtype=float)
+
+
+def score_file(clf, feature_list, filename, outfile, input_format="auto", batch_size=10000, name_field="name"):
+    """ score every record of filename into outfile as CSV rows,
+        returns the number of rows scored
+    """
+    if input_format == "auto":
+        input_format = detect_format(filename)
+    if input_format == "binary":
+        batches = store_batches(load_feature_store(filename), feature_list, batch_size)
+    elif input_format == "jsonl":
+        batches = record_batches(read_jsonl(filename, name_field), feature_list, batch_size)
+    elif input_format == "csv":
+        batches = record_batches(read_csv(filename, name_field), feature_list, batch_size)
+    elif input_format == "shards":
+        batches = record_batches(sorted_records(filename, name_field), feature_list, batch_size)
+    else:
+        raise ValueError("unknown input format: %r" % input_format)
+    writer = csv.writer(outfile)
+    writer.writerow(["name", "poi_probability"])
+    rows = 0
+    for names, features in batches:
+        writer.writerows(zip(names, positive_scores(clf, features)))
+        outfile.flush()
+        rows += len(names)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score records with the saved POI classifier.")
+    parser.add_argument("input", help="JSON lines, CSV or binary dataset file, or a directory of shards")
+    parser.add_argument("-o", "--output", help="CSV file to write, default stdout")
+    parser.add_argument("--format", dest="input_format", default="auto",
+                        choices=["auto", "jsonl", "csv", "binary", "shards"])
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--name-field", default="name")
+    args = parser.parse_args(argv)
+
+    clf, feature_list = load_classifier_and_feature_list()
+    outfile = open(args.output, "wb") if args.output else sys.stdout
+    start = time.time()
+    try:
+        rows = score_file(clf, feature_list, args.input, outfile, args.input_format, args.batch_size,
+                          args.name_field)
+    finally:
+        if args.output:
+            outfile.close()
+    elapsed = time.time() - start
+    print >> sys.stderr, THROUGHPUT_FORMAT_STRING.format(rows, elapsed, rows / elapsed if elapsed else 0.0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/python
+
+""" a long-running scoring service for the classifier saved by poi_id.py
+
+    the classifier and feature list are loaded once at start-up; every
+    request carries one record, and requests arriving together are queued
+    into micro-batches so the forest runs one vectorised predict_proba per
+    batch instead of one per record
+
+        python serve.py --port 8000
+        python serve.py --unix-socket /tmp/poi.sock
+
+        POST /score     {"name": ..., "salary": ..., ...}
+                        -> {"name": ..., "poi_probability": ...}
+        GET  /metrics   request count, p50/p99 latency, batch sizes
+        GET  /health
+
+    records are read like the JSON lines input of score.py
+"""
+
+import argparse
+import json
+import os
+import stat
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from collections import deque
+from Queue import Empty, Queue
+from SocketServer import ThreadingMixIn, UnixStreamServer
+
+import numpy
+
+from feature_engineering import null_as_nan
+from score import positive_scores, record_batches
+from tester import load_classifier_and_feature_list
+
+
+class _Request(object):
+    __slots__ = ("features", "received", "done", "score", "error")
+
+    def __init__(self, features):
+        self.features = features
+        self.received = time.time()
+        self.done = threading.Event()
+        self.score = None
+        self.error = None
+
+
+class MicroBatcher(object):
+    """ queues single records and scores them in batches of up to
+        max_batch_size, waiting at most max_wait seconds after the first
+        record of a batch for more to arrive
+    """
+
+    def __init__(self, clf, feature_list, max_batch_size=64, max_wait=0.005, samples=10000):
+        self.clf = clf
+        self.feature_list = feature_list
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = Queue()
+        self.latencies = deque(maxlen=samples)
+        self.batch_sizes = deque(maxlen=samples)
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def score(self, name, record):
+        """ block until the record has been scored, return its POI probability
+
+            the record is converted in the calling thread, so a bad record
+            raises here without failing the rest of its batch
+        """
+        names, features = next(record_batches([(name, record)], self.feature_list, 1))
+        request = _Request(features[0])
+        self.queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.score
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                features = numpy.vstack([request.features for request in batch])
+                for request, score in zip(batch, positive_scores(self.clf, features)):
+                    request.score = float(score)
+            except Exception:
+                ### score one at a time, so a bad request fails alone
+                for request in batch:
+                    try:
+                        request.score = float(positive_scores(self.clf, request.features[numpy.newaxis])[0])
+                    except Exception as e:
+                        request.error = e
+            finished = time.time()
+            with self.lock:
+                self.requests += len(batch)
+                self.batch_sizes.append(len(batch))
+                self.latencies.extend(finished - request.received for request in batch)
+            for request in batch:
+                request.done.set()
+
+    def metrics(self):
+        with self.lock:
+            latencies = numpy.array(self.latencies) * 1000.0
+            batch_sizes = numpy.array(self.batch_sizes)
+            requests = self.requests
+        if not len(latencies):
+            return {"requests": requests, "batches": 0}
+        return {"requests": requests,
+                "latency_ms_p50": float(numpy.percentile(latencies, 50)),
+                "latency_ms_p99": float(numpy.percentile(latencies, 99)),
+                "batches": len(batch_sizes),
+                "batch_size_mean": float(batch_sizes.mean()),
+                "batch_size_max": int(batch_sizes.max())}
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send_json(200, self.server.batcher.metrics())
+        elif self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/score":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            record = json.loads(self.rfile.read(int(self.headers.getheader("Content-Length", 0))))
+        except ValueError:
+            record = None
+        if not isinstance(record, dict):
+            self._send_json(400, {"error": "expected a JSON object"})
+            return
+        name = record.pop("name", None)
+        try:
+            score = self.server.batcher.score(name, null_as_nan(record))
+        except Exception as e:
+            ### whatever a malformed record raises is answered for it alone
+            self._send_json(400, {"error": "%s: %s" % (type(e).__name__, e)})
+            return
+        self._send_json(200, {"name": name, "poi_probability": score})
+
+    def address_string(self):
+        ### Unix socket clients have no (host, port) address
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        UnixStreamServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+def remove_socket(path):
+    """ remove the Unix socket at path, if there is one; any other file
+        there is a ValueError and is left alone
+    """
+    if not os.path.lexists(path):
+        return
+    if not stat.S_ISSOCK(os.lstat(path).st_mode):
+        raise ValueError("%s exists and is not a socket" % path)
+    os.remove(path)
+
+
+def make_server(batcher, host="127.0.0.1", port=8000, unix_socket=None, verbose=False):
+    if unix_socket:
+        remove_socket(unix_socket)
+        server = ThreadingUnixHTTPServer(unix_socket, ScoringHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), ScoringHandler)
+    server.batcher = batcher
+    server.verbose = verbose
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the saved POI classifier over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--unix-socket", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    clf, feature_list = load_classifier_and_feature_list()
+    batcher = MicroBatcher(clf, feature_list, args.max_batch_size, args.max_wait_ms / 1000.0)
+    try:
+        server = make_server(batcher, args.host, args.port, args.unix_socket, args.verbose)
+    except ValueError as e:
+        parser.error(str(e))
+    print "Serving", feature_list[1:], "on", args.unix_socket or "%s:%d" % (args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.unix_socket:
+            remove_socket(args.unix_socket)
+
+
+if __name__ == '__main__':
+    main()
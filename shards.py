@@ -0,0 +1,147 @@
+#!/usr/bin/python
+
+""" datasets too large to hold as a dict, kept on disk as sorted shards
+    and read back as fixed-size numeric blocks
+
+        write_shards(records, "dataset_shards", shard_size=100000)
+        for names, labels, features in feature_blocks(sorted_records("dataset_shards"),
+                                                      my_feature_list, block_size=10000):
+            ...
+
+    write_shards sorts (name, record) pairs a shard at a time and writes
+    every shard as JSON lines ({"name": ..., feature: value, ...}), the
+    input score.py reads. sorted_records merges the shards back by name,
+    holding one record per shard, and feature_blocks converts the stream
+    chunk by chunk. concatenated, its blocks are
+        labels, features = targetFeatureSplit(featureFormat(dataset, feature_list, sort_keys=True))
+    as arrays, except that a feature a record lacks counts as 'NaN'
+    instead of being an error
+"""
+
+import hashlib
+import heapq
+import json
+import os
+
+import numpy
+
+from feature_engineering import chunk_matrix, null_as_nan, record_chunks
+from feature_store import format_rows
+
+SHARD_FILENAME_FORMAT = "shard-{:05d}.jsonl"
+
+
+def _write_shard(chunk, filename, name_field):
+    chunk.sort(key=lambda pair: pair[0])
+    with open(filename, "w") as outfile:
+        for name, record in chunk:
+            line = dict(record)
+            line[name_field] = name
+            outfile.write(json.dumps(line) + "\n")
+
+
+def write_shards(records, directory, shard_size=100000, name_field="name"):
+    """ write a stream of (name, record) pairs as sorted shards of up to
+        shard_size records each, returns the shard filenames
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    filenames = []
+    for chunk in record_chunks(records, shard_size):
+        filenames.append(os.path.join(directory, SHARD_FILENAME_FORMAT.format(len(filenames))))
+        _write_shard(chunk, filenames[-1], name_field)
+    return filenames
+
+
+def shard_filenames(directory):
+    return sorted(os.path.join(directory, filename) for filename in os.listdir(directory)
+                  if filename.startswith("shard-") and filename.endswith(".jsonl"))
+
+
+def shards_digest(directory):
+    """ sha1 hex digest of the shard names and contents in directory """
+    digest = hashlib.sha1()
+    for filename in shard_filenames(directory):
+        digest.update(os.path.basename(filename))
+        with open(filename, "rb") as infile:
+            for block in iter(lambda: infile.read(1 << 20), ""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_shard(filename, shard, name_field):
+    ### the shard number breaks ties, so records themselves are never compared
+    with open(filename, "r") as infile:
+        for line in infile:
+            if line.strip():
+                record = json.loads(line)
+                yield record.pop(name_field), shard, null_as_nan(record)
+
+
+def sorted_records(directory, name_field="name"):
+    """ yield the (name, record) pairs of every shard in directory, merged
+        in name order; a name in more than one record is a ValueError
+    """
+    merged = heapq.merge(*[_read_shard(filename, shard, name_field)
+                           for shard, filename in enumerate(shard_filenames(directory))])
+    previous = None
+    for name, shard, record in merged:
+        if name == previous:
+            raise ValueError("record %s appears more than once in %s" % (name, directory))
+        previous = name
+        yield name, record
+
+
+def feature_blocks(records, feature_list, block_size=10000, dtype=numpy.float64, remove_NaN=True,
+                   remove_all_zeroes=True, remove_any_zeroes=False):
+    """ yield (names, labels, features) blocks of block_size rows (the last
+        one shorter) from a stream of (name, record) pairs
+
+        rows are filtered like featureFormat; labels is the first column
+        of feature_list and features the rest, both of dtype
+    """
+    pending = []
+    pending_rows = 0
+    for chunk in record_chunks(records, block_size):
+        values = chunk_matrix(chunk, feature_list)
+        keep, values = format_rows(values, numpy.isnan(values), feature_list, remove_NaN, remove_all_zeroes,
+                                   remove_any_zeroes)
+        pending.append(([name for (name, record), kept in zip(chunk, keep) if kept], values[keep]))
+        pending_rows += keep.sum()
+        while pending_rows >= block_size:
+            names, values = _take(pending, block_size)
+            pending_rows -= block_size
+            yield names, values[:, 0].astype(dtype), numpy.ascontiguousarray(values[:, 1:], dtype=dtype)
+    if pending_rows:
+        names, values = _take(pending, pending_rows)
+        yield names, values[:, 0].astype(dtype), numpy.ascontiguousarray(values[:, 1:], dtype=dtype)
+
+
+def _take(pending, rows):
+    """ the first rows rows of the pending (names, values) pieces, removed from pending """
+    names, blocks = [], []
+    while rows:
+        piece_names, piece_values = pending[0]
+        if len(piece_names) <= rows:
+            pending.pop(0)
+        else:
+            pending[0] = piece_names[rows:], piece_values[rows:]
+            piece_names, piece_values = piece_names[:rows], piece_values[:rows]
+        names.extend(piece_names)
+        blocks.append(piece_values)
+        rows -= len(piece_names)
+    return names, numpy.vstack(blocks)
+
+
+def block_arrays(blocks):
+    """ (names, labels, features) of all of feature_blocks' blocks, for
+        training; the rows are copied once, into arrays of the blocks' dtype
+    """
+    names, labels, features = [], [], []
+    for block_names, block_labels, block_features in blocks:
+        names.extend(block_names)
+        labels.append(block_labels)
+        features.append(block_features)
+    if not labels:
+        return [], numpy.empty(0), numpy.empty((0, 0))
+    return names, numpy.concatenate(labels), numpy.concatenate(features)
@@ -0,0 +1,301 @@
+#!/usr/bin/python
+
+""" running, mergeable per-feature statistics over a numeric matrix
+
+        stats = RunningStats(store.features)
+        for chunk in chunks:
+            stats.update(chunk)
+        stats.mean, stats.variance(), stats.quantile(0.99)
+
+    every update folds one chunk (rows x features, NaN for missing) into
+    the count, NaN count, mean, sum of squared deviations, min and max of
+    each feature, so statistics over new records never revisit old ones.
+    two RunningStats over different rows merge into the statistics of
+    all of them. quantiles come from a QuantileSketch per feature, which
+    is exact until it holds more than 2 * capacity values
+
+        stats = GroupedStats.from_store(store)
+        stats.print_table({0: "non-POI", 1: "POI"})
+
+    keeps one RunningStats per value of the poi label, for comparing the
+    groups feature by feature
+"""
+
+import numpy
+
+SKETCH_CAPACITY = 1024
+
+
+class QuantileSketch(object):
+    """ mergeable approximate quantiles of a stream of values
+
+        values are kept as (value, weight) centroids; once there are more
+        than 2 * capacity, neighbouring values are merged into at most
+        capacity centroids, smaller towards both tails (the arcsine scale
+        of a t-digest) so that extreme quantiles stay accurate. until then
+        quantile() is exactly numpy.percentile of the values seen, NaN
+        ignored
+    """
+
+    def __init__(self, capacity=SKETCH_CAPACITY):
+        self.capacity = capacity
+        self.values = numpy.empty(0)
+        self.weights = numpy.empty(0)
+        self.exact = True
+
+    @property
+    def count(self):
+        return self.weights.sum()
+
+    def update(self, values):
+        values = numpy.asarray(values, dtype=numpy.float64)
+        values = values[~numpy.isnan(values)]
+        self._add(values, numpy.ones(len(values)), True)
+        return self
+
+    def merge(self, other):
+        self._add(other.values, other.weights, other.exact)
+        return self
+
+    def _add(self, values, weights, exact):
+        self.values = numpy.concatenate([self.values, values])
+        self.weights = numpy.concatenate([self.weights, weights])
+        self.exact &= exact
+        if len(self.values) > 2 * self.capacity:
+            self._compress()
+
+    def _compress(self):
+        order = numpy.argsort(self.values, kind="mergesort")
+        values, weights = self.values[order], self.weights[order]
+        cumulative = numpy.cumsum(weights)
+        fractions = (cumulative - weights / 2) / cumulative[-1]
+        scale = numpy.arcsin(2 * fractions - 1) / numpy.pi + 0.5
+        groups = numpy.minimum((scale * self.capacity).astype(int), self.capacity - 1)
+        merged = numpy.bincount(groups, weights=weights, minlength=self.capacity)
+        occupied = merged > 0
+        self.values = (numpy.bincount(groups, weights=values * weights, minlength=self.capacity)[occupied] /
+                       merged[occupied])
+        self.weights = merged[occupied]
+        self.exact = False
+
+    def quantile(self, q):
+        """ q in [0, 1], a number or an array; NaN when nothing was seen """
+        if not len(self.values):
+            return numpy.full(numpy.shape(q), numpy.nan) if numpy.ndim(q) else numpy.nan
+        if self.exact:
+            return numpy.percentile(self.values, numpy.multiply(q, 100))
+        order = numpy.argsort(self.values)
+        values, weights = self.values[order], self.weights[order]
+        positions = (numpy.cumsum(weights) - weights / 2) / weights.sum()
+        return numpy.interp(q, positions, values)
+
+    def to_dict(self):
+        return {"capacity": self.capacity, "values": self.values.tolist(), "weights": self.weights.tolist(),
+                "exact": self.exact}
+
+    @classmethod
+    def from_dict(cls, state):
+        sketch = cls(state["capacity"])
+        sketch.values = numpy.array(state["values"], dtype=numpy.float64)
+        sketch.weights = numpy.array(state["weights"], dtype=numpy.float64)
+        sketch.exact = state["exact"]
+        return sketch
+
+
+class RunningStats(object):
+    """ count, nan_count, mean, min, max, variance() and quantile() of
+        every feature over all rows seen so far; NaN values only count
+        towards nan_count, as in pandas' mean and quantile
+    """
+
+    def __init__(self, features, capacity=SKETCH_CAPACITY):
+        size = len(features)
+        self.features = list(features)
+        self.rows = 0
+        self.count = numpy.zeros(size, dtype=int)
+        self.nan_count = numpy.zeros(size, dtype=int)
+        self.mean = numpy.zeros(size)
+        self.m2 = numpy.zeros(size)
+        self.min = numpy.full(size, numpy.inf)
+        self.max = numpy.full(size, -numpy.inf)
+        self.sketches = [QuantileSketch(capacity) for _ in features]
+
+    @classmethod
+    def from_store(cls, store, features=None, chunk_size=100000, capacity=SKETCH_CAPACITY):
+        """ statistics of a FeatureStore, read chunk_size rows at a time """
+        features = store.features if features is None else features
+        indices = store.column_indices(features)
+        stats = cls(features, capacity)
+        for start in range(0, len(store), chunk_size):
+            rows = slice(start, start + chunk_size)
+            stats.update(numpy.where(store.nan_mask[rows, indices], numpy.nan, store.matrix[rows, indices]))
+        return stats
+
+    def update(self, matrix):
+        """ fold in a rows x features chunk, NaN for missing values """
+        matrix = numpy.asarray(matrix, dtype=numpy.float64)
+        missing = numpy.isnan(matrix)
+        count = (~missing).sum(axis=0)
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            mean = numpy.where(count > 0, numpy.where(missing, 0.0, matrix).sum(axis=0) / count, 0.0)
+        m2 = numpy.where(missing, 0.0, matrix - mean) ** 2
+        self._combine(len(matrix), count, missing.sum(axis=0), mean, m2.sum(axis=0),
+                      numpy.where(missing, numpy.inf, matrix).min(axis=0, initial=numpy.inf),
+                      numpy.where(missing, -numpy.inf, matrix).max(axis=0, initial=-numpy.inf))
+        for sketch, column in zip(self.sketches, matrix.T):
+            sketch.update(column)
+        return self
+
+    def merge(self, other):
+        """ fold in the statistics of other rows with the same features """
+        if other.features != self.features:
+            raise ValueError("cannot merge statistics of different features")
+        self._combine(other.rows, other.count, other.nan_count, other.mean, other.m2, other.min, other.max)
+        for sketch, other_sketch in zip(self.sketches, other.sketches):
+            sketch.merge(other_sketch)
+        return self
+
+    def _combine(self, rows, count, nan_count, mean, m2, minimum, maximum):
+        ### Chan et al.'s pairwise update of the mean and squared deviations
+        total = self.count + count
+        delta = mean - self.mean
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            share = numpy.where(total > 0, 1.0 * count / total, 0.0)
+        self.mean = self.mean + delta * share
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * share
+        self.count = total
+        self.nan_count = self.nan_count + nan_count
+        self.rows += rows
+        self.min = numpy.minimum(self.min, minimum)
+        self.max = numpy.maximum(self.max, maximum)
+
+    def variance(self, ddof=1):
+        """ NaN for features with ddof or fewer values """
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            return numpy.where(self.count > ddof, self.m2 / (self.count - ddof), numpy.nan)
+
+    @property
+    def nan_rate(self):
+        return self.nan_count / float(self.rows) if self.rows else numpy.full(len(self.features), numpy.nan)
+
+    def quantile(self, q):
+        """ the q quantile of every feature """
+        return numpy.array([sketch.quantile(q) for sketch in self.sketches])
+
+    def to_dict(self):
+        return {"features": self.features, "rows": self.rows, "count": self.count.tolist(),
+                "nan_count": self.nan_count.tolist(), "mean": self.mean.tolist(), "m2": self.m2.tolist(),
+                "min": self.min.tolist(), "max": self.max.tolist(),
+                "sketches": [sketch.to_dict() for sketch in self.sketches]}
+
+    @classmethod
+    def from_dict(cls, state):
+        stats = cls(state["features"])
+        stats.rows = state["rows"]
+        stats.count = numpy.array(state["count"], dtype=int)
+        stats.nan_count = numpy.array(state["nan_count"], dtype=int)
+        for name in ("mean", "m2", "min", "max"):
+            setattr(stats, name, numpy.array(state[name], dtype=numpy.float64))
+        stats.sketches = [QuantileSketch.from_dict(sketch) for sketch in state["sketches"]]
+        return stats
+
+
+GROUPED_HEADER = "\t{:<26s}\t{:>8s}\t{:>6s}\t{:>5s}" + "\t{:>16s}" * 5
+GROUPED_FORMAT_STRING = "\t{:<26s}\t{:>8s}\t{:>6d}\t{:>5.0%}" + "\t{:>16,.2f}" * 5
+
+
+class GroupedStats(object):
+    """ one RunningStats per value of a label column, e.g. POIs and
+        non-POIs, filled in the same pass over the matrix
+
+        groups maps each label value seen to its RunningStats; partial
+        results over other chunks or rows merge like RunningStats do
+    """
+
+    def __init__(self, features, capacity=SKETCH_CAPACITY):
+        self.features = list(features)
+        self.capacity = capacity
+        self.groups = {}
+
+    @classmethod
+    def from_store(cls, store, features=None, label="poi", chunk_size=100000, capacity=SKETCH_CAPACITY):
+        """ statistics of a FeatureStore split by label (all other features
+            by default), read chunk_size rows at a time
+        """
+        if features is None:
+            features = [feature for feature in store.features if feature != label]
+        indices = store.column_indices(features)
+        column = store.column_indices([label])[0]
+        stats = cls(features, capacity)
+        for start in range(0, len(store), chunk_size):
+            rows = slice(start, start + chunk_size)
+            labels = numpy.where(store.nan_mask[rows, column], numpy.nan, store.matrix[rows, column])
+            stats.update(numpy.where(store.nan_mask[rows, indices], numpy.nan, store.matrix[rows, indices]), labels)
+        return stats
+
+    def group(self, value):
+        if value not in self.groups:
+            self.groups[value] = RunningStats(self.features, self.capacity)
+        return self.groups[value]
+
+    def update(self, matrix, labels):
+        """ fold in a rows x features chunk and the label of every row;
+            rows without a label (NaN) are left out
+        """
+        matrix = numpy.asarray(matrix, dtype=numpy.float64)
+        labels = numpy.asarray(labels, dtype=numpy.float64)
+        defined = ~numpy.isnan(labels)
+        values, inverse = numpy.unique(labels[defined], return_inverse=True)
+        matrix = matrix[defined]
+        for ii, value in enumerate(values):
+            self.group(value).update(matrix[inverse == ii])
+        return self
+
+    def merge(self, other):
+        if other.features != self.features:
+            raise ValueError("cannot merge statistics of different features")
+        for value, stats in other.groups.items():
+            self.group(value).merge(stats)
+        return self
+
+    def table(self, quantiles=(0.5,)):
+        """ one dict per feature and label value, features in order """
+        rows = []
+        summaries = []
+        for value in sorted(self.groups):
+            stats = self.groups[value]
+            summaries.append((value, stats, numpy.sqrt(stats.variance()), stats.nan_rate,
+                              [stats.quantile(q) for q in quantiles]))
+        for ii, feature in enumerate(self.features):
+            for value, stats, std, nan_rate, quantile_values in summaries:
+                seen = stats.count[ii] > 0
+                row = {"feature": feature, "label": value, "count": int(stats.count[ii]),
+                       "nan_rate": float(nan_rate[ii]), "mean": float(stats.mean[ii]) if seen else numpy.nan,
+                       "std": float(std[ii]), "min": float(stats.min[ii]) if seen else numpy.nan,
+                       "max": float(stats.max[ii]) if seen else numpy.nan}
+                for q, values in zip(quantiles, quantile_values):
+                    row["q%g" % (100 * q)] = float(values[ii])
+                rows.append(row)
+        return rows
+
+    def print_table(self, names=None):
+        """ count, NaN rate, mean, standard deviation, min, median and max
+            of every feature per label value; names maps label values to
+            the names printed, e.g. {0: "non-POI", 1: "POI"}
+        """
+        names = names or {}
+        print GROUPED_HEADER.format("feature", "group", "count", "NaN", "mean", "std", "min", "median", "max")
+        for row in self.table():
+            label = names.get(row["label"], "%g" % row["label"])
+            print GROUPED_FORMAT_STRING.format(row["feature"], label, row["count"], row["nan_rate"], row["mean"],
+                                               row["std"], row["min"], row["q50"], row["max"])
+
+    def to_dict(self):
+        return {"features": self.features, "capacity": self.capacity,
+                "groups": [[value, stats.to_dict()] for value, stats in sorted(self.groups.items())]}
+
+    @classmethod
+    def from_dict(cls, state):
+        stats = cls(state["features"], state["capacity"])
+        stats.groups = dict((value, RunningStats.from_dict(group)) for value, group in state["groups"])
+        return stats
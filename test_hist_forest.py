@@ -0,0 +1,58 @@
+#!/usr/bin/python
+
+""" python -m unittest test_hist_forest """
+
+import unittest
+
+import numpy
+
+from hist_forest import HistRandomForestClassifier, QuantileBinner
+from tester import evaluate_classifier
+
+FEATURE_LIST = ['poi', 'salary', 'bonus', 'expenses']
+COUNT_NAMES = ["true_positives", "false_positives", "false_negatives", "true_negatives"]
+
+
+def make_dataset(rows=146, seed=0):
+    """ a dataset dict with a POI signal in every feature and some 'NaN' """
+    random = numpy.random.RandomState(seed)
+    dataset = {}
+    for ii in range(rows):
+        poi = random.rand() < 0.2
+        record = {'poi': poi}
+        for feature in FEATURE_LIST[1:]:
+            value = random.lognormal(11 + poi, 1.0)
+            record[feature] = "NaN" if random.rand() < 0.2 else value
+        dataset["PERSON %03d" % ii] = record
+    return dataset
+
+
+class SharedBinnerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dataset = make_dataset()
+
+    def counts(self, clf, n_jobs):
+        result = evaluate_classifier(clf, self.dataset, FEATURE_LIST, folds=20, n_jobs=n_jobs)
+        return [result[name] for name in COUNT_NAMES]
+
+    def test_unfitted_binner_serial_matches_parallel(self):
+        binner = QuantileBinner(16)
+        clf = HistRandomForestClassifier(n_estimators=5, binner=binner, random_state=0)
+        serial = self.counts(clf, 1)
+        self.assertFalse(binner.is_fitted())
+        self.assertEqual(serial, self.counts(clf, 2))
+        self.assertFalse(binner.is_fitted())
+
+    def test_fitted_binner_is_reused(self):
+        features = numpy.array([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]])
+        binner = QuantileBinner(16).fit(features)
+        edges = [list(column) for column in binner.edges]
+        clf = HistRandomForestClassifier(n_estimators=2, binner=binner, random_state=0)
+        clf.fit(features * 10, [0, 1, 1])
+        self.assertIs(clf.binner_, binner)
+        self.assertEqual(edges, [list(column) for column in binner.edges])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/python
+
+""" python -m unittest test_tuning """
+
+import shutil
+import tempfile
+import unittest
+
+import numpy
+from sklearn.naive_bayes import GaussianNB
+from sklearn.tree import DecisionTreeClassifier
+
+from shards import write_shards
+from tuning import grid_search, successive_halving
+
+FEATURE_LIST = ['poi', 'salary', 'bonus', 'expenses']
+COUNT_NAMES = ["true_positives", "false_positives", "false_negatives", "true_negatives"]
+
+
+def make_dataset(rows=146, seed=0):
+    """ a dataset dict with a POI signal in every feature and some 'NaN' """
+    random = numpy.random.RandomState(seed)
+    dataset = {}
+    for ii in range(rows):
+        poi = random.rand() < 0.2
+        record = {'poi': poi}
+        for feature in FEATURE_LIST[1:]:
+            value = random.lognormal(11 + poi, 1.0)
+            record[feature] = "NaN" if random.rand() < 0.2 else value
+        dataset["PERSON %03d" % ii] = record
+    return dataset
+
+
+def counts(results):
+    return sorted((sorted(result["params"].items()), [result["counts"][name] for name in COUNT_NAMES])
+                  for result in results)
+
+
+class ShardTuningTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dataset = make_dataset()
+        self.directory = tempfile.mkdtemp(prefix="poi_shards_")
+        write_shards(sorted(self.dataset.items()), self.directory, shard_size=50)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_grid_search_on_shards_matches_dict(self):
+        param_grid = {'min_samples_leaf': [1, 5], 'random_state': [0]}
+        on_shards = grid_search(DecisionTreeClassifier(), param_grid, self.directory, FEATURE_LIST, folds=20,
+                                cache_filename=None)
+        on_dict = grid_search(DecisionTreeClassifier(), param_grid, self.dataset, FEATURE_LIST, folds=20,
+                              cache_filename=None)
+        self.assertEqual(counts(on_shards), counts(on_dict))
+        self.assertNotEqual(on_shards[0]["dataset"], on_dict[0]["dataset"])
+
+    def test_successive_halving_on_shards(self):
+        results, rounds = successive_halving(GaussianNB(), {'priors': [None, [0.5, 0.5]]}, self.directory,
+                                             FEATURE_LIST, min_folds=10, max_folds=20, eta=2,
+                                             cache_filename=None, verbose=False)
+        self.assertEqual(len(rounds), 2)
+        self.assertEqual(len(results), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,105 +7,605 @@
     be written to my_classifier.pkl, my_dataset.pkl, and
     my_feature_list.pkl, respectively
     that process should happen at the end of poi_id.py
+
+    python tester.py --profile-startup reports what each import costs
+    python tester.py --profile-folds folds.csv times every stage of every
+    fold and writes the samples to folds.csv (or .json)
+    python tester.py --threshold-sweep fits every fold once and prints the
+    precision and recall at the best F2 and F1 probability thresholds
+    python tester.py --cache-results keeps every result in
+    evaluation_results.jsonl and reuses it while nothing has changed
+    (see results_store.py for listing and comparing past runs)
 """
 
+import argparse
+import hashlib
+import math
+import os
 import pickle
 import sys
-from sklearn.cross_validation import StratifiedShuffleSplit
+import time
+from itertools import islice
 
-sys.path.append("../tools/")
-from feature_format import featureFormat, targetFeatureSplit
+### numpy, sklearn and feature_store are imported by the functions that use
+### them, so that dump/load of the pickles pulls in nothing heavy
 
 PERF_FORMAT_STRING = "\
 \tAccuracy: {:>0.{display_precision}f}\tPrecision: {:>0.{display_precision}f}\t\
 Recall: {:>0.{display_precision}f}\tF1: {:>0.{display_precision}f}\tF2: {:>0.{display_precision}f}"
 RESULTS_FORMAT_STRING = "\tTotal predictions: {:4d}\tTrue positives: {:4d}\tFalse positives: {:4d}\
 \tFalse negatives: {:4d}\tTrue negatives: {:4d}"
+FOLDS_FORMAT_STRING = "\tFolds used: {:4d} of {:4d}"
+CACHED_FORMAT_STRING = "\tCached result {} from {}"
+SEEDED_FORMAT_STRING = "\tEvaluated with {} = {}"
+FOLD_SEED = 42
 
 
-def test_classifier(clf, dataset, feature_list, folds=1000):
-    data = featureFormat(dataset, feature_list, sort_keys=True)
-    labels, features = targetFeatureSplit(data)
-    cv = StratifiedShuffleSplit(labels, folds, random_state=42)
-    true_negatives = 0
-    false_negatives = 0
-    true_positives = 0
-    false_positives = 0
-    for train_idx, test_idx in cv:
-        features_train = []
-        features_test = []
-        labels_train = []
-        labels_test = []
-        for ii in train_idx:
-            features_train.append(features[ii])
-            labels_train.append(labels[ii])
-        for jj in test_idx:
-            features_test.append(features[jj])
-            labels_test.append(labels[jj])
+def tally(predictions, truth):
+    """ [TN, FP, FN, TP] counts of 0/1 predictions against truth """
+    import numpy
+    valid = (predictions == 0) | (predictions == 1)
+    if not valid.all():
+        print "Warning: Found a predicted label not == 0 or 1."
+        print "All predictions should take value 0 or 1."
+        print "Evaluating performance for processed predictions:"
+        ### only tally the predictions made before the first bad one
+        cutoff = numpy.argmin(valid)
+        predictions = predictions[:cutoff]
+        truth = truth[:cutoff]
+    ### index 2*truth+prediction: 0 = TN, 1 = FP, 2 = FN, 3 = TP
+    return numpy.bincount((2 * truth + predictions).astype(int), minlength=4)
 
-        ### fit the classifier using training set, and test on test set
+
+def fold_counts(clf, features, labels, train_idx, test_idx, profiler=None, fold=0):
+    """ fit clf on one fold and return its [TN, FP, FN, TP] counts
+
+        with a profiler (see profiling.FoldProfiler), the slice, fit,
+        predict and tally stages are timed as fold number fold
+    """
+    import numpy
+    if profiler is not None:
+        return _profiled_fold_counts(clf, features, labels, train_idx, test_idx, profiler, fold)
+    clf.fit(features[train_idx], labels[train_idx])
+    predictions = numpy.asarray(clf.predict(features[test_idx]))
+    return tally(predictions, labels[test_idx])
+
+
+def _profiled_fold_counts(clf, features, labels, train_idx, test_idx, profiler, fold):
+    import numpy
+    with profiler.stage(fold, "slice"):
+        features_train, labels_train = features[train_idx], labels[train_idx]
+        features_test, truth = features[test_idx], labels[test_idx]
+    with profiler.stage(fold, "fit"):
         clf.fit(features_train, labels_train)
-        predictions = clf.predict(features_test)
-        for prediction, truth in zip(predictions, labels_test):
-            if prediction == 0 and truth == 0:
-                true_negatives += 1
-            elif prediction == 0 and truth == 1:
-                false_negatives += 1
-            elif prediction == 1 and truth == 0:
-                false_positives += 1
-            elif prediction == 1 and truth == 1:
-                true_positives += 1
-            else:
-                print "Warning: Found a predicted label not == 0 or 1."
-                print "All predictions should take value 0 or 1."
-                print "Evaluating performance for processed predictions:"
+    with profiler.stage(fold, "predict"):
+        predictions = numpy.asarray(clf.predict(features_test))
+    with profiler.stage(fold, "tally"):
+        counts = tally(predictions, truth)
+    return counts
+
+
+def _fold_counts_and_samples(clf, features, labels, train_idx, test_idx, profiler, fold):
+    ### process pool workers hand their samples back with the counts
+    counts = fold_counts(clf, features, labels, train_idx, test_idx, profiler, fold)
+    return counts, profiler.samples
+
+
+### each metric as a ratio of weighted [TN, FP, FN, TP] sums: (numerator, denominator)
+METRIC_RATIOS = {"precision": ((0, 0, 0, 1), (0, 1, 0, 1)), "recall": ((0, 0, 0, 1), (0, 0, 1, 1)),
+                 "f1": ((0, 0, 0, 2), (0, 1, 1, 2)), "f2": ((0, 0, 0, 5), (0, 1, 4, 5))}
+
+
+def metric_intervals(fold_counts, z=1.96):
+    """ intervals for precision, recall, F1 and F2 of the pooled counts,
+        from how they vary between folds
+
+        fold_counts holds one [TN, FP, FN, TP] row per fold. every metric
+        is a ratio of sums over the folds, whose standard error is taken
+        over folds, not over predictions: the folds overlap, so their
+        predictions are not independent trials. the interval is how much
+        the pooled metric could still move with other random folds of
+        this dataset, which is what early stopping needs; it is not a
+        confidence interval for the classifier on new data
+
+        a metric whose denominator is still 0 (precision of a classifier
+        that has not predicted a POI yet) has None for its interval
+    """
+    import numpy
+    counts = numpy.asarray(fold_counts, dtype=numpy.float64).reshape(-1, 4)
+    intervals = {}
+    for name, (numerator, denominator) in METRIC_RATIOS.items():
+        numerators, denominators = counts.dot(numerator), counts.dot(denominator)
+        total = denominators.sum()
+        if total == 0:
+            intervals[name] = None
+            continue
+        if len(counts) < 2:
+            intervals[name] = (0.0, 1.0)
+            continue
+        ratio = numerators.sum() / total
+        residuals = numerators - ratio * denominators
+        error = math.sqrt(len(counts) / (len(counts) - 1.0) * (residuals ** 2).sum()) / total
+        intervals[name] = (max(0.0, ratio - z * error), min(1.0, ratio + z * error))
+    return intervals
+
+
+def _run_folds(clf, features, labels, cv, n_jobs, profiler=None, first_fold=0):
+    """ list of [TN, FP, FN, TP] counts, one per fold in cv """
+    if profiler is not None:
+        return _run_profiled_folds(clf, features, labels, cv, n_jobs, profiler, first_fold)
+    if n_jobs == 1:
+        ### fit the classifier using training set, and test on test set
+        return [fold_counts(clf, features, labels, train_idx, test_idx) for train_idx, test_idx in cv]
+    from sklearn.base import clone
+    from sklearn.externals.joblib import Parallel, delayed
+    return Parallel(n_jobs=n_jobs)(
+        delayed(fold_counts)(clone(clf), features, labels, train_idx, test_idx)
+        for train_idx, test_idx in cv)
+
+
+def _run_profiled_folds(clf, features, labels, cv, n_jobs, profiler, first_fold):
+    splits = profiler.iter_splits(cv, first_fold)
+    if n_jobs == 1:
+        return [fold_counts(clf, features, labels, train_idx, test_idx, profiler, fold)
+                for fold, (train_idx, test_idx) in splits]
+    from sklearn.base import clone
+    from sklearn.externals.joblib import Parallel, delayed
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_fold_counts_and_samples)(clone(clf), features, labels, train_idx, test_idx, profiler.spawn(),
+                                          fold)
+        for fold, (train_idx, test_idx) in splits)
+    for counts, samples in results:
+        profiler.merge(samples)
+    return [counts for counts, samples in results]
+
+
+def labels_and_features(dataset, feature_list):
+    """ featureFormat + targetFeatureSplit as numpy arrays, for a dataset
+        dict, FeatureStore or directory of shards (see shards.py) and a
+        feature_list starting with 'poi'
+    """
+    import numpy
+    if isinstance(dataset, basestring):
+        from shards import block_arrays, feature_blocks, sorted_records
+        names, labels, features = block_arrays(feature_blocks(sorted_records(dataset), feature_list))
+        return labels, features
+    from feature_store import get_feature_store
+    data = get_feature_store(dataset).feature_format(feature_list)
+    return data[:, 0], numpy.ascontiguousarray(data[:, 1:])
+
+
+def fold_indices(labels, folds=1000, seed=FOLD_SEED):
+    """ the (train_idx, test_idx) splits every evaluation here uses """
+    from sklearn.cross_validation import StratifiedShuffleSplit
+    return StratifiedShuffleSplit(labels, folds, random_state=seed)
+
+
+def evaluate_classifier(clf, dataset, feature_list, folds=1000, n_jobs=1, tolerance=None, check_every=50,
+                        profiler=None, seed=FOLD_SEED):
+    """ the fold loop behind test_classifier, without the printing
+
+        returns a dict with the summed true_negatives, false_positives,
+        false_negatives and true_positives, and the number of folds used
+    """
+    import numpy
+    labels, features = labels_and_features(dataset, feature_list)
+    cv = iter(fold_indices(labels, folds, seed))
+    batch_size = folds if tolerance is None else check_every
+    all_results = []
+    while len(all_results) < folds:
+        fold_results = _run_folds(clf, features, labels, islice(cv, batch_size), n_jobs, profiler,
+                                  len(all_results))
+        if not fold_results:
+            break
+        all_results.extend(fold_results)
+        if tolerance is not None:
+            ### an undefined metric cannot narrow; the defined ones decide
+            defined = [interval for interval in metric_intervals(all_results).values() if interval is not None]
+            if all(high - low < tolerance for low, high in defined):
                 break
+    counts = numpy.sum(all_results, axis=0) if all_results else numpy.zeros(4, dtype=int)
+    true_negatives, false_positives, false_negatives, true_positives = [int(c) for c in counts]
+    return {"true_negatives": true_negatives, "false_positives": false_positives,
+            "false_negatives": false_negatives, "true_positives": true_positives, "folds": len(all_results)}
+
+
+def performance_metrics(true_positives, false_positives, false_negatives, true_negatives):
+    """ raises ZeroDivisionError when a metric is undefined, e.g. precision
+        with no positive predictions
+    """
+    total_predictions = true_negatives + false_negatives + false_positives + true_positives
+    accuracy = 1.0 * (true_positives + true_negatives) / total_predictions
+    precision = 1.0 * true_positives / (true_positives + false_positives)
+    recall = 1.0 * true_positives / (true_positives + false_negatives)
+    f1 = 2.0 * true_positives / (2 * true_positives + false_positives + false_negatives)
+    f2 = (1 + 2.0 * 2.0) * precision * recall / (4 * precision + recall)
+    return {"total_predictions": total_predictions, "accuracy": accuracy, "precision": precision,
+            "recall": recall, "f1": f1, "f2": f2}
+
+
+def test_classifier(clf, dataset, feature_list, folds=1000, n_jobs=1, tolerance=None, check_every=50,
+                    profiler=None, results=None):
+    """ n_jobs > 1 (or -1 for all cores) fits a clone of clf for each
+        fold in a process pool; the summed counts match the serial run
+
+        with a tolerance set, folds are run check_every at a time and
+        evaluation stops early once the 95% fold-level intervals of
+        precision, recall, F1 and F2 (see metric_intervals) are all
+        narrower than tolerance, leaving out a metric that is undefined
+        (precision, while no POI has been predicted)
+
+        dataset may be a dataset dict, a FeatureStore or a directory of
+        shards
+
+        a profiler (profiling.FoldProfiler) collects per-fold timings of
+        each stage and its summary is printed after the results
+
+        with results (a results_store.ResultsStore), an evaluation of the
+        same classifier parameters, feature list, dataset and folds is
+        read back from the store instead of being run again, and new ones
+        are added to it; a random_state of None is evaluated as the fold
+        seed. profiled runs are always run
+    """
+    record = None
+    if results is not None and profiler is None:
+        record = results.evaluate(clf, dataset, feature_list, folds, n_jobs, tolerance, check_every)
+        result = record["counts"]
+    else:
+        result = evaluate_classifier(clf, dataset, feature_list, folds, n_jobs, tolerance, check_every, profiler)
+    true_negatives = result["true_negatives"]
+    false_negatives = result["false_negatives"]
+    true_positives = result["true_positives"]
+    false_positives = result["false_positives"]
     try:
-        total_predictions = true_negatives + false_negatives + false_positives + true_positives
-        accuracy = 1.0 * (true_positives + true_negatives) / total_predictions
-        precision = 1.0 * true_positives / (true_positives + false_positives)
-        recall = 1.0 * true_positives / (true_positives + false_negatives)
-        f1 = 2.0 * true_positives / (2 * true_positives + false_positives + false_negatives)
-        f2 = (1 + 2.0 * 2.0) * precision * recall / (4 * precision + recall)
+        metrics = performance_metrics(true_positives, false_positives, false_negatives, true_negatives)
         print clf
-        print PERF_FORMAT_STRING.format(accuracy, precision, recall, f1, f2, display_precision=5)
-        print RESULTS_FORMAT_STRING.format(total_predictions, true_positives, false_positives, false_negatives,
-                                           true_negatives)
+        print PERF_FORMAT_STRING.format(metrics["accuracy"], metrics["precision"], metrics["recall"],
+                                        metrics["f1"], metrics["f2"], display_precision=5)
+        print RESULTS_FORMAT_STRING.format(metrics["total_predictions"], true_positives, false_positives,
+                                           false_negatives, true_negatives)
+        if tolerance is not None:
+            print FOLDS_FORMAT_STRING.format(result["folds"], folds)
+        if record is not None and record.get("seeded"):
+            print SEEDED_FORMAT_STRING.format(", ".join(record["seeded"]), record["seed"])
+        if record is not None and record["cached"]:
+            print CACHED_FORMAT_STRING.format(record["key"][:10], record["created"])
+        if profiler is not None:
+            profiler.print_summary()
         print ""
     except:
         print "Got a divide by zero when trying out:", clf
         print "Precision or recall may be undefined due to a lack of true positive predicitons."
 
 
+COMPARISON_HEADER = "\t{:>24s}\t{:>9s}\t{:>9s}\t{:>9s}\t{:>9s}\t{:>9s}\t{:>9s}\t{:>11s}".format(
+    "classifier", "Accuracy", "Precision", "Recall", "F1", "F2", "fit s", "predict s")
+COMPARISON_FORMAT_STRING = "\t{:>24s}\t{:>9s}\t{:>9s}\t{:>9s}\t{:>9s}\t{:>9s}\t{:>9.3f}\t{:>11.3f}"
+
+
+def _timed_fold_counts(clf, features_train, labels_train, features_test, truth):
+    """ [TN, FP, FN, TP] counts of one fit/predict, with their seconds """
+    import numpy
+    start = time.time()
+    clf.fit(features_train, labels_train)
+    fitted = time.time()
+    predictions = numpy.asarray(clf.predict(features_test))
+    predicted = time.time()
+    return tally(predictions, truth), fitted - start, predicted - fitted
+
+
+def _comparison_jobs(classifiers, features, labels, cv):
+    ### each fold is sliced once and the slices are shared by every classifier
+    for train_idx, test_idx in cv:
+        features_train, labels_train = features[train_idx], labels[train_idx]
+        features_test, truth = features[test_idx], labels[test_idx]
+        for clf in classifiers:
+            yield clf, features_train, labels_train, features_test, truth
+
+
+def compare_classifiers(classifiers, dataset, feature_list, folds=1000, n_jobs=1, names=None):
+    """ evaluate several classifiers on the same tester folds in one pass
+
+        the feature matrix, fold indices and train/test slices are built
+        once and shared; with n_jobs != 1 every (classifier, fold) fit runs
+        as its own job in a process pool. returns one dict per classifier,
+        in order, with its name, summed counts, metrics (empty when
+        precision or recall is undefined) and total fit and predict seconds
+    """
+    import numpy
+    from sklearn.base import clone
+    classifiers = [clone(clf) for clf in classifiers]
+    if names is None:
+        names = [type(clf).__name__ for clf in classifiers]
+    labels, features = labels_and_features(dataset, feature_list)
+    jobs = _comparison_jobs(classifiers, features, labels, fold_indices(labels, folds))
+    if n_jobs == 1:
+        fold_results = [_timed_fold_counts(*job) for job in jobs]
+    else:
+        from sklearn.externals.joblib import Parallel, delayed
+        fold_results = Parallel(n_jobs=n_jobs)(
+            delayed(_timed_fold_counts)(clone(job[0]), *job[1:]) for job in jobs)
+    counts = numpy.zeros((len(classifiers), 4), dtype=int)
+    seconds = numpy.zeros((len(classifiers), 2))
+    ### jobs cycle through the classifiers fold by fold
+    for job, (job_counts, fit_seconds, predict_seconds) in enumerate(fold_results):
+        model = job % len(classifiers)
+        counts[model] += job_counts
+        seconds[model] += fit_seconds, predict_seconds
+    results = []
+    for model, clf in enumerate(classifiers):
+        true_negatives, false_positives, false_negatives, true_positives = [int(c) for c in counts[model]]
+        try:
+            metrics = performance_metrics(true_positives, false_positives, false_negatives, true_negatives)
+        except ZeroDivisionError:
+            metrics = {}
+        results.append({"name": names[model], "classifier": clf, "true_negatives": true_negatives,
+                        "false_positives": false_positives, "false_negatives": false_negatives,
+                        "true_positives": true_positives, "metrics": metrics,
+                        "fit_seconds": float(seconds[model, 0]), "predict_seconds": float(seconds[model, 1])})
+    return results
+
+
+def print_comparison(results):
+    """ one row per compare_classifiers result, "-" for undefined metrics """
+    print COMPARISON_HEADER
+    for result in results:
+        metrics = result["metrics"]
+        values = ["{:0.5f}".format(metrics[name]) if name in metrics else "-"
+                  for name in ("accuracy", "precision", "recall", "f1", "f2")]
+        print COMPARISON_FORMAT_STRING.format(result["name"], *(values + [result["fit_seconds"],
+                                                                          result["predict_seconds"]]))
+
+
+SWEEP_HEADER = ("\t{:>10s}" + "\t{:>9s}" * 5 + "\t{:>6s}" * 4).format(
+    "", "Threshold", "Precision", "Recall", "F1", "F2", "TP", "FP", "FN", "TN")
+SWEEP_FORMAT_STRING = "\t{:>10s}\t{:>9.5f}\t{:>9.5f}\t{:>9.5f}\t{:>9.5f}\t{:>9.5f}\t{:>6d}\t{:>6d}\t{:>6d}\t{:>6d}"
+
+
+def fold_scores(clf, features, labels, train_idx, test_idx):
+    """ fit clf on one fold and return the POI scores of its test rows """
+    from score import positive_scores
+    clf.fit(features[train_idx], labels[train_idx])
+    return positive_scores(clf, features[test_idx])
+
+
+def out_of_fold_scores(clf, dataset, feature_list, folds=1000, n_jobs=1):
+    """ (scores, truth) of every test row of every tester fold, fold by
+        fold; scores are predict_proba of the POI class, or the 0/1
+        predictions of classifiers without predict_proba
+    """
+    import numpy
+    labels, features = labels_and_features(dataset, feature_list)
+    cv = list(fold_indices(labels, folds))
+    if n_jobs == 1:
+        scores = [fold_scores(clf, features, labels, train_idx, test_idx) for train_idx, test_idx in cv]
+    else:
+        from sklearn.base import clone
+        from sklearn.externals.joblib import Parallel, delayed
+        scores = Parallel(n_jobs=n_jobs)(
+            delayed(fold_scores)(clone(clf), features, labels, train_idx, test_idx) for train_idx, test_idx in cv)
+    truth = [labels[test_idx] for train_idx, test_idx in cv]
+    return numpy.concatenate(scores), numpy.concatenate(truth)
+
+
+def threshold_sweep(scores, truth):
+    """ counts and metrics at every distinct score taken as the threshold
+        (rows scoring at least the threshold predicted POI), in one sort
+
+        returns a dict of arrays, highest threshold first: threshold,
+        true_positives, false_positives, false_negatives, true_negatives,
+        precision, recall, f1 and f2 (NaN recall without any POI)
+    """
+    import numpy
+    scores = numpy.asarray(scores, dtype=numpy.float64)
+    positive = numpy.asarray(truth) == 1
+    order = numpy.argsort(-scores, kind="mergesort")
+    scores, positive = scores[order], positive[order]
+    ### each threshold keeps everything up to the last row of its run of equal scores
+    cuts = numpy.append(numpy.flatnonzero(numpy.diff(scores)), len(scores) - 1)
+    true_positives = numpy.cumsum(positive)[cuts]
+    false_positives = cuts + 1 - true_positives
+    false_negatives = positive.sum() - true_positives
+    true_negatives = len(scores) - positive.sum() - false_positives
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        precision = 1.0 * true_positives / (cuts + 1)
+        recall = 1.0 * true_positives / (true_positives + false_negatives)
+        f1 = 2.0 * true_positives / (2 * true_positives + false_positives + false_negatives)
+        f2 = numpy.where(true_positives > 0, 5.0 * precision * recall / (4 * precision + recall), 0.0)
+    return {"threshold": scores[cuts], "true_positives": true_positives, "false_positives": false_positives,
+            "false_negatives": false_negatives, "true_negatives": true_negatives, "precision": precision,
+            "recall": recall, "f1": f1, "f2": f2}
+
+
+def sweep_point(sweep, index):
+    """ one threshold of a threshold_sweep, as a dict of numbers """
+    return dict((name, values[index].item()) for name, values in sweep.items())
+
+
+def best_threshold(sweep, metric="f2"):
+    """ the threshold_sweep point with the highest metric, the highest
+        threshold among ties
+    """
+    import numpy
+    return sweep_point(sweep, int(numpy.nanargmax(sweep[metric])))
+
+
+def default_threshold(sweep):
+    """ the point predict gives for a two-class predict_proba, which
+        picks the POI class when its probability is above 0.5
+    """
+    import numpy
+    above = numpy.flatnonzero(sweep["threshold"] > 0.5)
+    if not len(above):
+        return None
+    return sweep_point(sweep, above[-1])
+
+
+def print_threshold_sweep(sweep):
+    """ the best F2 and F1 thresholds and the predict one """
+    print SWEEP_HEADER
+    points = [("best F2", best_threshold(sweep, "f2")), ("best F1", best_threshold(sweep, "f1")),
+              ("predict", default_threshold(sweep))]
+    for label, point in points:
+        if point is not None:
+            print SWEEP_FORMAT_STRING.format(label, point["threshold"], point["precision"], point["recall"],
+                                             point["f1"], point["f2"], point["true_positives"],
+                                             point["false_positives"], point["false_negatives"],
+                                             point["true_negatives"])
+
+
 CLF_PICKLE_FILENAME = "my_classifier.pkl"
 DATASET_PICKLE_FILENAME = "my_dataset.pkl"
+DATASET_BINARY_FILENAME = "my_dataset.bin"
 FEATURE_LIST_FILENAME = "my_feature_list.pkl"
+MODEL_ARTIFACT_FILENAME = "my_classifier.model"
 
 
-def dump_classifier_and_data(clf, dataset, feature_list):
+def dump_classifier_and_data(clf, dataset, feature_list, dataset_format="pickle"):
+    """ the dataset is pickled as a dict, a FeatureStore converted back to
+        one; dataset_format="binary" writes it as a FeatureStore file
+        instead, only numeric features kept
+
+        fitted tree ensembles are also written as a model artifact, which
+        load_classifier_and_feature_list reads in place of the pickle it
+        was written with; an artifact of an earlier classifier is left in
+        place and no longer read
+    """
     with open(CLF_PICKLE_FILENAME, "w") as clf_outfile:
         pickle.dump(clf, clf_outfile)
-    with open(DATASET_PICKLE_FILENAME, "w") as dataset_outfile:
-        pickle.dump(dataset, dataset_outfile)
+    ### only fitted trees and ensembles have these, and only they need model_artifact (and numpy)
+    if hasattr(clf, "tree_") or hasattr(clf, "estimators_"):
+        from model_artifact import dump_model, supports
+        if supports(clf):
+            dump_model(clf, feature_list, MODEL_ARTIFACT_FILENAME, dataset, source=file_digest(CLF_PICKLE_FILENAME))
+    if dataset_format == "binary":
+        from feature_store import get_feature_store
+        get_feature_store(dataset).dump(DATASET_BINARY_FILENAME)
+    elif dataset_format == "pickle":
+        if hasattr(dataset, "to_dataset"):
+            dataset = dataset.to_dataset()
+        with open(DATASET_PICKLE_FILENAME, "w") as dataset_outfile:
+            pickle.dump(dataset, dataset_outfile)
+    else:
+        raise ValueError("unknown dataset_format: %r" % dataset_format)
     with open(FEATURE_LIST_FILENAME, "w") as featurelist_outfile:
         pickle.dump(feature_list, featurelist_outfile)
 
 
-def load_classifier_and_data():
+def file_digest(filename):
+    """ sha1 hex digest of a file's bytes """
+    digest = hashlib.sha1()
+    with open(filename, "rb") as infile:
+        for block in iter(lambda: infile.read(1 << 20), ""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_classifier_and_feature_list():
+    """ only what scoring needs: the classifier and its feature list
+
+        the model artifact written with the pickled classifier (or with
+        no pickle left beside it) is loaded instead, as a
+        model_artifact.ForestModel
+    """
+    if os.path.exists(MODEL_ARTIFACT_FILENAME):
+        from model_artifact import load_model
+        model = load_model(MODEL_ARTIFACT_FILENAME)
+        if not os.path.exists(CLF_PICKLE_FILENAME) or model.manifest.get("source") == file_digest(CLF_PICKLE_FILENAME):
+            return model, model.feature_list
+    with open(CLF_PICKLE_FILENAME, "r") as clf_infile:
+        clf = pickle.load(clf_infile)
+    with open(FEATURE_LIST_FILENAME, "r") as featurelist_infile:
+        feature_list = pickle.load(featurelist_infile)
+    return clf, feature_list
+
+
+def load_classifier_and_data(dataset_format="pickle"):
+    """ dataset_format="binary" returns the dataset as a memory-mapped
+        FeatureStore, which test_classifier accepts in place of a dict
+    """
     with open(CLF_PICKLE_FILENAME, "r") as clf_infile:
         clf = pickle.load(clf_infile)
-    with open(DATASET_PICKLE_FILENAME, "r") as dataset_infile:
-        dataset = pickle.load(dataset_infile)
+    if dataset_format == "binary":
+        from feature_store import load_feature_store
+        dataset = load_feature_store(DATASET_BINARY_FILENAME)
+    elif dataset_format == "pickle":
+        with open(DATASET_PICKLE_FILENAME, "r") as dataset_infile:
+            dataset = pickle.load(dataset_infile)
+    else:
+        raise ValueError("unknown dataset_format: %r" % dataset_format)
     with open(FEATURE_LIST_FILENAME, "r") as featurelist_infile:
         feature_list = pickle.load(featurelist_infile)
     return clf, dataset, feature_list
 
 
-def main():
+STARTUP_MODULES = ["numpy", "scipy", "sklearn", "sklearn.cross_validation", "sklearn.base",
+                   "sklearn.externals.joblib", "sklearn.ensemble", "feature_store"]
+STARTUP_FORMAT_STRING = "\t{:>28s}\t{:>8.1f} ms\t{:>8.1f} ms"
+
+
+def profile_startup(modules=STARTUP_MODULES):
+    """ print what importing each module the evaluation path needs costs,
+        in the order they would be imported; modules loaded by an earlier
+        one show (close to) zero
+    """
+    print "\t{:>28s}\t{:>11s}\t{:>11s}".format("module", "import", "cumulative")
+    total = 0.0
+    for module in modules:
+        if module in sys.modules:
+            elapsed = 0.0
+        else:
+            start = time.time()
+            __import__(module)
+            elapsed = time.time() - start
+        total += elapsed
+        print STARTUP_FORMAT_STRING.format(module, elapsed * 1000, total * 1000)
+    for label, filename in (("unpickle classifier", CLF_PICKLE_FILENAME),
+                            ("unpickle dataset", DATASET_PICKLE_FILENAME),
+                            ("unpickle feature list", FEATURE_LIST_FILENAME)):
+        if os.path.exists(filename):
+            start = time.time()
+            with open(filename, "r") as infile:
+                pickle.load(infile)
+            elapsed = time.time() - start
+            total += elapsed
+            print STARTUP_FORMAT_STRING.format(label, elapsed * 1000, total * 1000)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Test the classifier saved by poi_id.py.")
+    parser.add_argument("--profile-startup", action="store_true", help="report what each import costs")
+    parser.add_argument("--profile-folds", metavar="FILE",
+                        help="time every stage of every fold, samples written to FILE (.csv or .json)")
+    parser.add_argument("--threshold-sweep", action="store_true",
+                        help="print precision and recall at the best F2 and F1 probability thresholds")
+    parser.add_argument("--cache-results", action="store_true",
+                        help="keep results in evaluation_results.jsonl and reuse them")
+    args = parser.parse_args(argv)
+    if args.profile_startup:
+        profile_startup()
+        return
+    profiler = None
+    if args.profile_folds:
+        from profiling import FoldProfiler
+        profiler = FoldProfiler()
+    results = None
+    if args.cache_results:
+        from results_store import ResultsStore
+        results = ResultsStore()
     ### load up student's classifier, dataset, and feature_list
     clf, dataset, feature_list = load_classifier_and_data()
+    if args.threshold_sweep:
+        print clf
+        print_threshold_sweep(threshold_sweep(*out_of_fold_scores(clf, dataset, feature_list)))
+        return
     ### Run testing script
-    test_classifier(clf, dataset, feature_list)
+    test_classifier(clf, dataset, feature_list, profiler=profiler, results=results)
+    if profiler is not None:
+        if args.profile_folds.endswith(".json"):
+            profiler.to_json(args.profile_folds)
+        else:
+            profiler.to_csv(args.profile_folds)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,199 @@
+#!/usr/bin/python
+
+""" hyperparameter search scored with the same stratified shuffle split
+    protocol as tester.test_classifier
+
+    every candidate is fitted on the tester folds (random_state=42) and
+    scored from the summed confusion counts; candidates run across a
+    process pool and each result is appended to a JSON lines cache keyed
+    on (estimator, params, feature list, dataset digest, folds), so a
+    re-run only evaluates combinations it has not seen before
+
+        results = grid_search(RandomForestClassifier(), param_grid,
+                              my_dataset, my_feature_list, n_jobs=-1)
+        print_results(results)
+
+    successive_halving gives large grids the same compute as small ones:
+    every candidate starts on a few folds and only the best fraction of
+    each round moves on to a round with more folds
+"""
+
+import hashlib
+import json
+import os
+import types
+
+import numpy
+from sklearn.base import clone
+from sklearn.externals.joblib import Parallel, delayed
+from sklearn.model_selection import ParameterGrid, ParameterSampler
+
+from feature_store import dataset_digest, get_feature_store
+from tester import evaluate_classifier, performance_metrics
+
+TUNING_CACHE_FILENAME = "tuning_cache.jsonl"
+SCORE_FORMAT_STRING = "\t{:>8s}: {:>0.5f}\t{}"
+ROUND_FORMAT_STRING = "Round {:d}: {:d} candidates on {:d} folds"
+ROUND_RESULT_FORMAT_STRING = "\tF1: {:>0.5f}\tF2: {:>0.5f}\t{}"
+
+
+class TuningCache(object):
+    """ append-only JSON lines file of scored candidates """
+
+    def __init__(self, filename=TUNING_CACHE_FILENAME):
+        self.filename = filename
+        self.records = {}
+        if os.path.exists(filename):
+            with open(filename, "r") as cache_file:
+                for line in cache_file:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.records[record["key"]] = record
+
+    def get(self, key):
+        return self.records.get(key)
+
+    def put(self, record):
+        self.records[record["key"]] = record
+        with open(self.filename, "a") as cache_file:
+            cache_file.write(json.dumps(record, sort_keys=True) + "\n")
+
+
+def param_state(value):
+    """ value, a parameter or an estimator, as plain JSON data that is the
+        same in every process, for cache keys
+
+        estimators become their class and param_state of their
+        get_params(deep=False), other objects their class and attributes,
+        functions and classes their qualified name and numpy values lists
+        or numbers; anything else (a lambda, a RandomState) is a TypeError
+        rather than a repr holding a memory address
+    """
+    if value is None or isinstance(value, (bool, int, long, float, basestring)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [param_state(item) for item in value]
+    if isinstance(value, dict):
+        return dict((str(key), param_state(item)) for key, item in value.items())
+    if isinstance(value, numpy.ndarray):
+        return value.tolist()
+    if isinstance(value, numpy.generic):
+        return value.item()
+    if isinstance(value, (type, types.FunctionType, types.BuiltinFunctionType)):
+        if value.__name__ == "<lambda>":
+            raise TypeError("a lambda has no stable name to key on")
+        return {"name": "%s.%s" % (value.__module__, value.__name__)}
+    name = "%s.%s" % (type(value).__module__, type(value).__name__)
+    if hasattr(value, "get_params"):
+        return {"class": name, "params": param_state(value.get_params(deep=False))}
+    if hasattr(value, "__dict__"):
+        return {"class": name, "state": param_state(vars(value))}
+    raise TypeError("cannot key on a parameter of type %s" % name)
+
+
+def candidate_key(estimator, params, feature_list, digest, folds):
+    """ sha1 over everything that determines a candidate's score """
+    all_params = estimator.get_params(deep=False)
+    all_params.update(params)
+    description = [type(estimator).__name__, sorted(param_state(all_params).items()), list(feature_list), digest,
+                   folds]
+    return hashlib.sha1(json.dumps(description, sort_keys=True)).hexdigest()
+
+
+def score_result(result, scoring):
+    """ the scoring metric of an evaluated candidate, 0 when undefined """
+    return result["metrics"].get(scoring) or 0.0
+
+
+def evaluate_candidate(estimator, params, dataset, feature_list, folds=1000):
+    """ fit a clone of estimator with params on the tester folds and
+        return its counts and metrics (metrics is empty when precision or
+        recall is undefined)
+    """
+    clf = clone(estimator).set_params(**params)
+    counts = evaluate_classifier(clf, dataset, feature_list, folds)
+    try:
+        metrics = performance_metrics(counts["true_positives"], counts["false_positives"],
+                                      counts["false_negatives"], counts["true_negatives"])
+    except ZeroDivisionError:
+        metrics = {}
+    return {"params": params, "counts": counts, "metrics": metrics}
+
+
+def evaluate_candidates(estimator, candidates, dataset, feature_list, folds=1000, n_jobs=1,
+                        cache_filename=TUNING_CACHE_FILENAME):
+    """ evaluate every params dict in candidates, reusing cached results
+
+        dataset is a dict, a FeatureStore or a directory of shards, which
+        every candidate reads for itself; returns the results in the order
+        of candidates
+    """
+    digest = dataset_digest(dataset)
+    if not isinstance(dataset, basestring):
+        dataset = get_feature_store(dataset)
+    cache = TuningCache(cache_filename) if cache_filename else None
+    keys = [candidate_key(estimator, params, feature_list, digest, folds) for params in candidates]
+    results = [cache.get(key) if cache else None for key in keys]
+    pending = [ii for ii, result in enumerate(results) if result is None]
+    evaluated = Parallel(n_jobs=n_jobs)(
+        delayed(evaluate_candidate)(estimator, candidates[ii], dataset, feature_list, folds)
+        for ii in pending)
+    for ii, result in zip(pending, evaluated):
+        result["key"] = keys[ii]
+        result["feature_list"] = list(feature_list)
+        result["dataset"] = digest
+        if cache:
+            cache.put(result)
+        results[ii] = result
+    return results
+
+
+def grid_search(estimator, param_grid, dataset, feature_list, folds=1000, n_jobs=1, scoring="f1",
+                cache_filename=TUNING_CACHE_FILENAME):
+    """ evaluate every combination in param_grid, best scoring first
+
+        the best estimator is clone(estimator).set_params(**results[0]["params"])
+    """
+    candidates = list(ParameterGrid(param_grid))
+    results = evaluate_candidates(estimator, candidates, dataset, feature_list, folds, n_jobs, cache_filename)
+    return sorted(results, key=lambda result: score_result(result, scoring), reverse=True)
+
+
+def print_results(results, scoring="f1", top=10):
+    for result in results[:top]:
+        print SCORE_FORMAT_STRING.format(scoring, score_result(result, scoring), result["params"])
+
+
+def successive_halving(estimator, param_grid, dataset, feature_list, min_folds=25, max_folds=1000, eta=3,
+                       n_candidates=None, n_jobs=1, scoring="f1", cache_filename=TUNING_CACHE_FILENAME,
+                       random_state=None, verbose=True):
+    """ successive halving over param_grid, scored on the tester folds
+
+        every candidate is first evaluated on min_folds folds; after each
+        round the best 1/eta of the candidates are kept and the number of
+        folds is multiplied by eta, up to max_folds. n_candidates samples
+        that many combinations from param_grid instead of the full grid
+        (lists are sampled uniformly, scipy distributions with rvs())
+
+        returns the results of the last round, best scoring first, and a
+        list with the results of every round
+    """
+    if n_candidates is None:
+        candidates = list(ParameterGrid(param_grid))
+    else:
+        candidates = list(ParameterSampler(param_grid, n_candidates, random_state=random_state))
+    folds = min_folds
+    rounds = []
+    while True:
+        results = evaluate_candidates(estimator, candidates, dataset, feature_list, folds, n_jobs, cache_filename)
+        results = sorted(results, key=lambda result: score_result(result, scoring), reverse=True)
+        rounds.append(results)
+        if verbose:
+            print ROUND_FORMAT_STRING.format(len(rounds), len(candidates), folds)
+            for result in results[:max(1, len(results) // eta)]:
+                print ROUND_RESULT_FORMAT_STRING.format(score_result(result, "f1"), score_result(result, "f2"),
+                                                        result["params"])
+        if len(candidates) == 1 or folds >= max_folds:
+            return results, rounds
+        candidates = [result["params"] for result in results[:max(1, len(results) // eta)]]
+        folds = min(folds * eta, max_folds)